@@ -0,0 +1,173 @@
+# Headless batch runs described by a JSON job manifest
+#
+# A manifest replaces the GUI workflow (question pages -> data/output<n> pools ->
+# final H5P sets) with one file:
+#
+#   {
+#       "questions": "questions.json",    # list of question specs, or a path relative to the manifest
+#       "count": 50,                       # overrides randomization_count of every question
+#       "seed": 1234,
+#       "output_dir": "run-1",             # relative to the manifest
+#       "control": {"NAME_H5P": "quiz.h5p", "TITLE": "Week 3"},
+#       "final_sets": 10,
+#       "workers": 4
+#   }
+#
+# Progress is reported as one JSON object per line (see emit); logs go to stderr.
+
+import copy
+import glob
+import json
+import os
+import sys
+import time
+
+try:
+    import backend.logic as logic
+    import backend.txt2h5p.parser as h5p_parser
+except ModuleNotFoundError:
+    import logic
+    import txt2h5p.parser as h5p_parser
+
+# Every key a manifest may contain, with its default.
+MANIFEST_DEFAULTS = {
+    "questions": None,
+    "count": None,
+    "seed": None,
+    "output_dir": ".",
+    "control": {},
+    "final_sets": 1,
+    "workers": 1,
+    "batch": False,
+    "format": "json",
+    "timeout": None,
+    "parse_cache": None,
+    "pool_cache": None,
+    "unique_variants": True,
+    "reject_collisions": True,
+}
+
+
+class ManifestError(ValueError):
+    """
+    The manifest is malformed, or running it would overwrite earlier output.
+    """
+
+
+def load_manifest(path):
+    """
+    Reads and validates the manifest at path. Returns it with the defaults filled in,
+    "questions" loaded into a list, and output_dir and the cache directories resolved
+    against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ManifestError(f"Cannot read manifest {path}: {e}") from e
+    if not isinstance(manifest, dict):
+        raise ManifestError("The manifest must be a JSON object.")
+
+    unknown = sorted(set(manifest) - set(MANIFEST_DEFAULTS))
+    if unknown:
+        raise ManifestError(f"Unknown manifest keys: {', '.join(unknown)}")
+    manifest = {**MANIFEST_DEFAULTS, **manifest}
+
+    questions = manifest["questions"]
+    if isinstance(questions, str):
+        questions_path = os.path.join(base, questions)
+        try:
+            with open(questions_path, "r") as f:
+                questions = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ManifestError(f"Cannot read questions {questions_path}: {e}") from e
+    if not isinstance(questions, list) or not questions:
+        raise ManifestError("\"questions\" must be a non-empty list of question specs or a path to one.")
+    manifest["questions"] = questions
+
+    for key, minimum in (("count", 1), ("final_sets", 0), ("workers", 1)):
+        value = manifest[key]
+        if value is None and key == "count":
+            continue
+        if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+            raise ManifestError(f"\"{key}\" must be an integer >= {minimum}.")
+    if manifest["seed"] is not None and (not isinstance(manifest["seed"], int) or isinstance(manifest["seed"], bool)):
+        raise ManifestError("\"seed\" must be an integer.")
+    if manifest["format"] not in ("json", "jsonl", "pool"):
+        raise ManifestError("\"format\" must be \"json\", \"jsonl\" or \"pool\".")
+    if not isinstance(manifest["control"], dict):
+        raise ManifestError("\"control\" must be an object of control file fields.")
+
+    manifest["output_dir"] = os.path.join(base, manifest["output_dir"])
+    for key in ("parse_cache", "pool_cache"):
+        if manifest[key] is not None:
+            manifest[key] = os.path.join(base, manifest[key])
+    return manifest
+
+
+def emit(stream, event, **fields):
+    """
+    Writes one progress event as a JSON line and flushes it, so a supervising
+    process sees it immediately.
+    """
+    stream.write(json.dumps({"event": event, **fields}) + "\n")
+    stream.flush()
+
+
+def run(manifest, stream=sys.stdout):
+    """
+    Runs a manifest from load_manifest: writes one pool per question to
+    <output_dir>/data/output<n>.json/.txt, then final_sets packages drawn from the
+    pools. The seed makes both the pools and the packages reproducible. Refuses to
+    run when output_dir already holds pools, since they would be mixed into the
+    final sets. Emits start, question, final_set and done events to stream and
+    returns the done event's fields.
+    """
+    output_dir = manifest["output_dir"]
+    existing = glob.glob(os.path.join(output_dir, "data", "output*"))
+    if existing:
+        raise ManifestError(f"{output_dir} already contains generated pools; choose an empty output_dir.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # The control file of the run lives next to its outputs; the bundled one only
+    # supplies the fields the manifest leaves out.
+    control_file = os.path.join(output_dir, "control.txt")
+    h5p_parser.write_control_file(control_file, {**h5p_parser.read_control_file(h5p_parser.CONTROL_FILE),
+                                                 **manifest["control"]})
+
+    instance = logic.Logic(output_format=manifest["format"], unique_variants=manifest["unique_variants"],
+                           reject_collisions=manifest["reject_collisions"],
+                           timeout=manifest["timeout"], parse_cache_dir=manifest["parse_cache"],
+                           pool_cache_dir=manifest["pool_cache"], output_dir=output_dir, seed=manifest["seed"])
+    instance.control_file = control_file
+
+    data_list = manifest["questions"]
+    if manifest["count"] is not None:
+        data_list = [{**copy.deepcopy(data), "randomization_count": manifest["count"]} for data in data_list]
+
+    started = time.monotonic()
+    emit(stream, "start", questions=len(data_list), output_dir=output_dir, seed=manifest["seed"])
+    total = 0
+    try:
+        question_variants = instance.iter_question_variants(data_list, manifest["batch"], manifest["workers"])
+        for index, (data, variants) in enumerate(question_variants, 1):
+            written = instance.save_pool(variants)
+            total += written
+            emit(stream, "question", index=index, total=len(data_list), question=data.get("latex_question", ""),
+                 variants=written, requested=data.get("randomization_count", 1), pool=instance.path_to_output_json,
+                 elapsed=round(time.monotonic() - started, 3))
+
+        packages = []
+        if manifest["final_sets"] > 0:
+            packages = instance.generate_final_h5p_set(
+                manifest["final_sets"], workers=manifest["workers"],
+                progress=lambda done, count: emit(stream, "final_set", index=done, total=count,
+                                                  elapsed=round(time.monotonic() - started, 3)))
+    finally:
+        instance.close_evaluator()
+
+    result = {"questions": len(data_list), "variants": total, "packages": packages,
+              "seconds": round(time.monotonic() - started, 3)}
+    emit(stream, "done", **result)
+    return result
@@ -0,0 +1,84 @@
+# Runs slow symbolic evaluations in a separate process that can be killed on timeout
+
+import multiprocessing
+import time
+
+
+class EvaluationTimeout(TimeoutError):
+    """
+    Raised when an isolated evaluation does not finish within its time budget.
+    """
+
+
+def _serve(connection, settings):
+    """
+    Worker loop: receives (method, args, precision) requests, calls the method on its
+    own Logic instance and sends back ("ok", result) or ("error", exception).
+    """
+    try:
+        import backend.logic as logic
+    except ModuleNotFoundError:
+        import logic
+
+    instance = logic.Logic(**settings)
+    while True:
+        try:
+            method, args, precision = connection.recv()
+        except EOFError:
+            return
+        instance.precision = precision
+        try:
+            connection.send(("ok", getattr(instance, method)(*args)))
+        except Exception as e:
+            connection.send(("error", e))
+
+
+class IsolatedEvaluator:
+    """
+    Calls Logic methods in a worker process. A call that exceeds its timeout kills the
+    worker, which is restarted on the next call, so a runaway sp.solve or integral
+    never blocks the caller for longer than the budget.
+    """
+    def __init__(self, settings):
+        # The worker evaluates in-process; it must not start an evaluator of its own.
+        self.settings = {**settings, 'timeout': None, 'profile': False, 'trace': False}
+        self.process = None
+        self.connection = None
+
+    def start(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child, self.settings), daemon=True)
+        self.process.start()
+        child.close()
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.connection.close()
+        self.process = None
+        self.connection = None
+
+    def call(self, method, args, precision, timeout):
+        """
+        Returns getattr(Logic, method)(*args) evaluated in the worker, re-raises the
+        worker's exception, or raises EvaluationTimeout after timeout seconds.
+        """
+        if self.process is None or not self.process.is_alive():
+            self.close()
+            self.start()
+
+        started = time.monotonic()
+        self.connection.send((method, args, precision))
+        if not self.connection.poll(max(timeout, 0)):
+            self.close()
+            raise EvaluationTimeout(f"{method} did not finish within {time.monotonic() - started:.1f}s")
+
+        try:
+            status, result = self.connection.recv()
+        except EOFError:
+            self.close()
+            raise EvaluationTimeout(f"the worker exited while running {method}")
+        if status == "error":
+            raise result
+        return result
@@ -0,0 +1,156 @@
+# Per-stage counters and timings for the generation pipeline
+
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    """
+    Context manager timing one occurrence of a stage.
+    """
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.started, time.perf_counter_ns() - self.started)
+        return False
+
+
+class Profiler:
+    """
+    Records how often each stage runs and how long it takes, per question (see
+    set_question). With trace=True every occurrence is also kept as an event for
+    write_trace.
+    """
+    enabled = True
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.question = ""
+        # (question, stage) -> [count, nanoseconds]
+        self.stats = {}
+        self.events = []
+
+    def set_question(self, question):
+        self.question = question
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def timed(self, name, iterable):
+        """
+        Yields the items of iterable, timing every step of it as the stage name.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def record(self, name, started, duration):
+        entry = self.stats.get((self.question, name))
+        if entry is None:
+            self.stats[(self.question, name)] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+        if self.trace:
+            self.events.append((name, self.question, started, duration, os.getpid(), threading.get_ident()))
+
+    def export(self):
+        """
+        The recorded data in a picklable form, for merging into another profiler.
+        """
+        return {"stats": self.stats, "events": self.events}
+
+    def merge(self, exported):
+        for key, (count, duration) in exported["stats"].items():
+            entry = self.stats.setdefault(key, [0, 0])
+            entry[0] += count
+            entry[1] += duration
+        if self.trace:
+            self.events.extend(exported["events"])
+
+    def summary(self):
+        """
+        Returns {"stages": {stage: totals}, "questions": {question: {stage: totals}}},
+        where totals holds count, seconds and mean_ms.
+        """
+        def totals(count, duration):
+            return {"count": count, "seconds": duration / 1e9, "mean_ms": duration / 1e6 / count}
+
+        stages = {}
+        questions = {}
+        for (question, name), (count, duration) in self.stats.items():
+            stage = stages.setdefault(name, [0, 0])
+            stage[0] += count
+            stage[1] += duration
+            questions.setdefault(question, {})[name] = totals(count, duration)
+        return {
+            "stages": {name: totals(*stage) for name, stage in sorted(stages.items(), key=lambda item: -item[1][1])},
+            "questions": questions,
+        }
+
+    def format_summary(self):
+        lines = [f"{'stage':<20} {'count':>9} {'total s':>10} {'mean ms':>10}"]
+        for name, stage in self.summary()["stages"].items():
+            lines.append(f"{name:<20} {stage['count']:>9} {stage['seconds']:>10.3f} {stage['mean_ms']:>10.3f}")
+        return "\n".join(lines)
+
+    def write_trace(self, path):
+        """
+        Writes the events in the Chrome trace event format, readable by
+        chrome://tracing, Perfetto and speedscope.
+        """
+        events = [{
+            "name": name,
+            "cat": "logic",
+            "ph": "X",
+            "ts": started / 1e3,
+            "dur": duration / 1e3,
+            "pid": pid,
+            "tid": tid,
+            "args": {"question": question},
+        } for name, question, started, duration, pid, tid in self.events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class NullProfiler:
+    """
+    The disabled profiler: every stage is a shared no-op context manager.
+    """
+    enabled = False
+
+    def set_question(self, question):
+        pass
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def timed(self, name, iterable):
+        return iterable
+
+    def export(self):
+        return None
+
+    def merge(self, exported):
+        pass
+
+
+NULL = NullProfiler()
@@ -0,0 +1,378 @@
+# Precompiled LaTeX templates for rendering substituted expressions
+#
+# sp.latex(expr.subs(params)) walks and prints the whole tree for every variant,
+# although only the parameter values change. A LatexTemplate prints the expression
+# once with sentinel numbers in place of the parameters and afterwards only splices
+# the printed values into that string.
+#
+# What the printer does with a number depends on its class: 0 and 1 drop out, a
+# negative coefficient turns "+" into "-", a rational becomes \frac{..}{..} around
+# its neighbours. A template is therefore built per tuple of value classes (see
+# value_class), with sentinels of that class. It is only used when every parameter
+# sits in a slot where SymPy cannot combine its value with another number (see
+# is_templatable), so any value of a class prints like the sentinel, and the first
+# rendering of every class is checked against sp.latex.
+#
+# Expressions whose values fold (a/b, a*b, (a + b)/2) cannot be templated, but with
+# exact parameter values they reduce to a constant. Those are computed with SymPy
+# numbers through a lambdified callable and printed once per distinct result (see
+# LatexTemplate.constant), instead of substituting into the tree for every variant.
+
+import numbers
+import re
+
+import numpy as np
+import sympy as sp
+from sympy.printing.pycode import SymPyPrinter
+
+try:
+    import backend.util as util
+    import backend.vectorized as vectorized
+except ModuleNotFoundError:
+    import util
+    import vectorized
+
+SENTINEL_BASE = 1000003
+# Constant results printed before the lambdified callable of an expression is trusted
+# (each compared with sp.latex of the substituted expression), and printed results kept.
+CONSTANT_CHECKS = 4
+CONSTANT_CACHE_SIZE = 4096
+
+# Containers whose arguments are printed as they are and never folded together.
+CONTAINERS = (sp.Tuple, sp.Integral, sp.Sum, sp.Product, sp.Limit)
+
+
+def value_class(value):
+    """
+    The class of a parameter value that decides how it prints, or None when the
+    value cannot be templated: "0", "1", "-1", "+" and "-" for integers; "1/2",
+    "-1/2", "1/q", "-1/q" for unit fractions (x/q, roots) and "r+"/"r-" for other
+    rationals; "f0", "f+"/"f-" for floats.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, numbers.Integral):
+        value = int(value)
+        if value in (0, 1, -1):
+            return str(value)
+        return "+" if value > 0 else "-"
+    if isinstance(value, numbers.Rational):
+        value = sp.Rational(value)
+        if value.q == 1:
+            return value_class(int(value.p))
+        if abs(value.p) == 1:
+            unit = "1/2" if value.q == 2 else "1/q"
+            return unit if value > 0 else f"-{unit}"
+        return "r+" if value > 0 else "r-"
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if value == 0:
+            # -0.0 prints with its sign.
+            return "f0" if str(value) == "0.0" else None
+        # Outside this range (and for nan/inf) floats print in scientific notation.
+        if not 1e-4 <= abs(value) < 1e15:
+            return None
+        return "f+" if value > 0 else "f-"
+    return None
+
+
+def has_free_symbols(node, symbols):
+    return bool(node.free_symbols - symbols)
+
+
+def is_templatable(node, symbols):
+    """
+    True when every occurrence of the parameter symbols is a slot whose value SymPy
+    keeps as a separate number: a coefficient with no number other than -1 next to
+    it, an Add term whose monomial no other term shares, an exponent of a symbolic
+    base, a bound of an integral/sum/limit, or a side of a relation whose sides share
+    no symbol.
+    """
+    if not node.has(*symbols) or node in symbols:
+        return True
+
+    if node.is_Add:
+        # x**a merges with another term in the same base for some values of a.
+        exponent_bases = [power.base for term in node.args for power in term.atoms(sp.Pow)
+                          if power.exp in symbols]
+        for base in exponent_bases:
+            if sum(term.has(base) for term in node.args) > 1:
+                return False
+        monomials = []
+        for term in node.args:
+            if not is_templatable(term, symbols):
+                return False
+            coefficient, monomial = term.as_coeff_Mul()
+            if monomial.is_Mul:
+                monomial = sp.Mul(*[factor for factor in monomial.args if factor not in symbols])
+            elif monomial in symbols:
+                monomial = sp.S.One
+            monomials.append((monomial, term.has(*symbols)))
+        for i, (monomial, parametric) in enumerate(monomials):
+            if parametric and any(other == monomial for j, (other, _) in enumerate(monomials) if j != i):
+                return False
+        return True
+
+    if node.is_Mul:
+        direct = [factor for factor in node.args if factor in symbols]
+        numeric = any(factor.is_Number for factor in node.args)
+        # -1 only flips the sign, and the sign is part of the value class.
+        if len(direct) > 1 or (direct and numeric and node.args[0] is not sp.S.NegativeOne):
+            return False
+        if (direct or numeric) and any(factor.is_Add and factor.has(*symbols) for factor in node.args):
+            return False
+        if direct and not numeric and not has_free_symbols(node, symbols):
+            return False
+        return all(is_templatable(factor, symbols) for factor in node.args if factor not in symbols)
+
+    if node.is_Pow:
+        base, exponent = node.args
+        if base.has(*symbols):
+            return base.is_Add and not exponent.has(*symbols) and is_templatable(base, symbols)
+        return (exponent in symbols and has_free_symbols(base, symbols)
+                and not base.is_Mul and not base.is_Number)
+
+    if node.is_Relational:
+        lhs, rhs = node.args
+        if (lhs.free_symbols - symbols) & (rhs.free_symbols - symbols):
+            return False
+        return has_free_symbols(node, symbols) and is_templatable(lhs, symbols) and is_templatable(rhs, symbols)
+
+    if isinstance(node, CONTAINERS):
+        return all(is_templatable(arg, symbols) for arg in node.args)
+
+    if isinstance(node, sp.Function):
+        return all(has_free_symbols(arg, symbols) and is_templatable(arg, symbols) for arg in node.args)
+
+    return False
+
+
+class ExactPrinter(SymPyPrinter):
+    """
+    Prints rational constants as SymPy Rationals, so a lambdified expression called
+    with SymPy numbers computes exactly what substituting them would.
+    """
+    def _print_Rational(self, expr):
+        return f"Rational({expr.p}, {expr.q})"
+
+    _print_Half = _print_Rational
+
+
+def exact_function(expr, symbols):
+    """
+    expr lambdified over symbols for SymPy number arguments, or None when it has other
+    free symbols or Float constants (whose rounding depends on the evaluation order).
+    """
+    if not symbols or expr.free_symbols != set(symbols) or expr.atoms(sp.Float):
+        return None
+    printer = ExactPrinter({"fully_qualified_modules": False, "inline": True,
+                            "allow_unknown_functions": True, "user_functions": {}})
+    try:
+        return sp.lambdify(symbols, expr, modules=[{"Rational": sp.Rational}, "sympy"], printer=printer)
+    except Exception as e:
+        util.logger.debug(f"Could not lambdify {expr} for exact evaluation: {e}")
+        return None
+
+
+def rational_latex(numerator, denominator):
+    """
+    sp.latex of the Rational numerator/denominator (in lowest terms, with a positive
+    denominator), without going through the printer.
+    """
+    if denominator == 1:
+        return str(numerator)
+    return f"{'- ' if numerator < 0 else ''}\\frac{{{abs(numerator)}}}{{{denominator}}}"
+
+
+def exact_batch(expr, parameter_names, samples, count, values):
+    """
+    The LaTeX of a rational function of integer parameters for every sampled row, as a
+    function of the row index, computed exactly over the whole batch (see
+    vectorized.RationalArray). values, the float results of evaluate_batch, catch the
+    rows where the int64 arithmetic overflowed; those rows, and rows where the value is
+    undefined, return None. Returns None when expr does not qualify, or when one of the
+    first CONSTANT_CHECKS rows differs from sp.latex of the substituted expression.
+    """
+    symbols = [sp.Symbol(name) for name in parameter_names if name in samples]
+    if (values is None or not symbols or not expr.free_symbols <= set(symbols)
+            or not vectorized.is_rational_function(expr)
+            or not all(samples[symbol.name].dtype.kind == "i" for symbol in symbols)):
+        return None
+    printer = ExactPrinter({"fully_qualified_modules": False, "inline": True,
+                            "allow_unknown_functions": True, "user_functions": {}})
+    try:
+        func = sp.lambdify(symbols, expr, modules=[{"Rational": vectorized.RationalArray}], printer=printer)
+        with np.errstate(all="ignore"):
+            result = vectorized.RationalArray.of(func(*[vectorized.RationalArray(samples[symbol.name])
+                                                        for symbol in symbols]))
+            numerators = np.broadcast_to(result.numerators, (count,))
+            denominators = np.broadcast_to(result.denominators, (count,))
+            exact = (denominators > 0) & np.isclose(numerators / np.where(denominators > 0, denominators, 1),
+                                                    values, rtol=1e-9, atol=0)
+    except Exception as e:
+        util.logger.debug(f"Could not evaluate {expr} exactly over the batch: {e}")
+        return None
+
+    def latex(i):
+        return rational_latex(int(numerators[i]), int(denominators[i])) if exact[i] else None
+    for i in np.flatnonzero(exact)[:CONSTANT_CHECKS]:
+        params = {symbol.name: samples[symbol.name][i].item() for symbol in symbols}
+        if latex(i) != sp.latex(expr.subs(params)):
+            util.logger.debug(f"Exact evaluation of {expr} differs from sp.latex; not using it.")
+            return None
+    return latex
+
+
+class LatexTemplate:
+    """
+    Renders sp.latex(expr.subs(params)) for parameter dicts. Parameters without a
+    value class, expressions that are not templatable and classes whose template
+    did not reproduce sp.latex are printed with sp.latex, or through constant when
+    the parameter values are exact.
+    """
+    def __init__(self, expr, names):
+        self.expr = expr
+        symbols = {symbol for symbol in expr.free_symbols if symbol.name in set(names)}
+        self.symbols = sorted(symbols, key=lambda symbol: symbol.name)
+        self.enabled = bool(self.symbols) and is_templatable(expr, symbols)
+        # value classes -> list of literal strings and (name, part) pieces, or None
+        self.templates = {}
+        self.texts = {}
+        self.sentinels = {}
+        number = SENTINEL_BASE
+        for symbol in self.symbols:
+            numerator = sp.nextprime(number)
+            denominator = sp.nextprime(numerator)
+            self.sentinels[symbol.name] = (numerator, denominator)
+            number = denominator + 100
+        self.exact = exact_function(expr, self.symbols)
+        self.constants = util.LRUCache(CONSTANT_CACHE_SIZE)
+        self.checks = CONSTANT_CHECKS
+
+    def render(self, params, substituted=None):
+        """
+        The LaTeX of the expression with params substituted. substituted, when the
+        caller already has expr.subs(params), saves redoing it on a fallback.
+        """
+        if self.enabled:
+            classes = tuple(value_class(params.get(symbol.name)) for symbol in self.symbols)
+            if None not in classes:
+                template = self.templates.get(classes, False)
+                if template is False:
+                    return self.build(classes, params, substituted)
+                if template is not None:
+                    return "".join(piece if isinstance(piece, str) else self.text(params[piece[0]], piece[1])
+                                   for piece in template)
+        return self.latex(params, substituted)
+
+    def latex(self, params, substituted=None):
+        if substituted is None and self.exact is not None:
+            text = self.constant(params)
+            if text is not None:
+                return text
+        if substituted is None:
+            substituted = self.expr.subs(params)
+        return sp.latex(substituted)
+
+    def constant(self, params):
+        """
+        The LaTeX of the expression for integer or rational params, computed by the
+        exact callable, or None when the result is not a constant. Rational results are
+        printed directly, others once per distinct result. The first CONSTANT_CHECKS
+        results are compared with sp.latex of the substituted expression; a mismatch
+        turns the exact callable off.
+        """
+        values = [params.get(symbol.name) for symbol in self.symbols]
+        if not all(isinstance(value, numbers.Rational) and not isinstance(value, bool) for value in values):
+            return None
+        try:
+            result = self.exact(*[sp.Rational(value) for value in values])
+        except Exception:
+            return None
+        if isinstance(result, sp.Rational):
+            text = rational_latex(result.p, result.q)
+        elif isinstance(result, sp.Basic) and not result.free_symbols:
+            text = self.constants.get(result)
+            if text is None:
+                text = self.constants[result] = sp.latex(result)
+        else:
+            return None
+        if self.checks:
+            if text != sp.latex(self.expr.subs(params)):
+                util.logger.debug(f"Exact evaluation of {self.expr} differs from sp.latex; not using it.")
+                self.exact = None
+                return None
+            self.checks -= 1
+        return text
+
+    def sentinel(self, name, value_class_):
+        numerator, denominator = self.sentinels[name]
+        sign = -1 if value_class_.startswith("-") or value_class_.endswith("-") else 1
+        if value_class_ in ("+", "-"):
+            return sign * sp.Integer(numerator), {str(numerator): (name, "abs")}
+        if value_class_ in ("r+", "r-"):
+            return sign * sp.Rational(numerator, denominator), {str(numerator): (name, "numerator"),
+                                                                 str(denominator): (name, "denominator")}
+        if value_class_ in ("1/q", "-1/q"):
+            return sign * sp.Rational(1, denominator), {str(denominator): (name, "denominator")}
+        if value_class_ in ("f+", "f-"):
+            value = sp.Float(numerator + 0.5)
+            return sign * value, {sp.latex(value): (name, "abs")}
+        # 0, 1, -1, 1/2, -1/2 and 0.0 are single values, so they stand for themselves.
+        return {"0": sp.S.Zero, "1": sp.S.One, "-1": sp.S.NegativeOne, "1/2": sp.S.Half, "-1/2": -sp.S.Half,
+                "f0": sp.Float(0.0)}[value_class_], {}
+
+    def build(self, classes, params, substituted):
+        """
+        Prints the template of classes, splits it at the sentinels and keeps it if it
+        reproduces sp.latex for params. Returns sp.latex for params either way.
+        """
+        replacements = {}
+        pieces_of = {}
+        for symbol, value_class_ in zip(self.symbols, classes):
+            replacements[symbol], texts = self.sentinel(symbol.name, value_class_)
+            pieces_of.update(texts)
+
+        expected = self.latex(params, substituted)
+        template = None
+        try:
+            filled = self.expr.subs(replacements)
+            # A class that turns a part into a constant (x**0, 0*x) lets Eq, Max and the
+            # like compare values, which a class does not pin down.
+            if filled.free_symbols != self.expr.free_symbols - set(self.symbols):
+                raise ValueError("the class folds symbols away")
+            printed = sp.latex(filled)
+            if pieces_of:
+                pattern = re.compile(r"(?<![0-9.])(" + "|".join(map(re.escape, pieces_of)) + r")(?![0-9.])")
+                template = [piece if i % 2 == 0 else pieces_of[piece]
+                            for i, piece in enumerate(pattern.split(printed))]
+            else:
+                template = [printed]
+            rendered = "".join(piece if isinstance(piece, str) else self.text(params[piece[0]], piece[1])
+                               for piece in template)
+            if rendered != expected:
+                util.logger.debug(f"LaTeX template of {self.expr} for {classes} differs from sp.latex; not using it.")
+                template = None
+        except Exception as e:
+            util.logger.debug(f"Could not build the LaTeX template of {self.expr} for {classes}: {e}")
+            template = None
+        self.templates[classes] = template
+        return expected
+
+    def text(self, value, part):
+        """
+        The printed form of the absolute value of value (or of its numerator or
+        denominator), as sp.latex prints it inside an expression.
+        """
+        key = (type(value), value, part)
+        text = self.texts.get(key)
+        if text is None:
+            number = abs(sp.sympify(value))
+            if part == "numerator":
+                text = str(sp.Rational(number).p)
+            elif part == "denominator":
+                text = str(sp.Rational(number).q)
+            else:
+                text = sp.latex(number)
+            self.texts[key] = text
+        return text
@@ -1,9 +1,14 @@
 import random
 import glob
+import hashlib
+import itertools
+import math
+import numpy as np
 import sympy as sp
 import json
 import os
-from sympy.parsing.latex import parse_latex
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 try:
     import backend.txt2h5p.parser as h5p_parser
@@ -15,116 +20,331 @@ try:
 except ModuleNotFoundError:
     import util
 
+try:
+    import backend.vectorized as vectorized
+except ModuleNotFoundError:
+    import vectorized
+
+try:
+    import backend.sampling as sampling
+except ModuleNotFoundError:
+    import sampling
+
+try:
+    import backend.evaluator as evaluator
+except ModuleNotFoundError:
+    import evaluator
+
+try:
+    import backend.writers as writers
+except ModuleNotFoundError:
+    import writers
+
+try:
+    import backend.parse_cache as parse_cache
+except ModuleNotFoundError:
+    import parse_cache
+
+try:
+    import backend.instrumentation as instrumentation
+except ModuleNotFoundError:
+    import instrumentation
+
+try:
+    import backend.pool_cache as pool_cache
+except ModuleNotFoundError:
+    import pool_cache
+
+try:
+    import backend.pool_store as pool_store
+except ModuleNotFoundError:
+    import pool_store
+
+try:
+    import backend.latex_template as latex_template
+except ModuleNotFoundError:
+    import latex_template
+
+# Objects that are left unevaluated by doit() when it cannot find a closed form.
+UNEVALUATED_TYPES = (sp.Integral, sp.Derivative, sp.Limit, sp.Sum, sp.Product)
+
+# Entries kept under keep_compiled: compiled answers and parameter spaces per spec, and
+# final-set pools per spec and seed (a server sees a new seed for every student).
+COMPILED_CACHE_SIZE = 256
+POOL_CACHE_SIZE = 64
+
+class GenerationCancelled(Exception):
+    """
+    Raised by perform_logic and generate_final_h5p_set when their cancel event is set.
+    """
+
 class Logic:
-    def __init__(self):
+    def __init__(self, compile_expressions=True, solve_equations_once=True, output_format="json",
+                 unique_variants=True, timeout=None, max_retries=3, parse_cache_dir=None,
+                 profile=False, trace=False, output_dir="", pool_cache_dir=None, template_latex=True,
+                 reject_collisions=True, collision_retries=10, seed=None, keep_compiled=False):
         # Used for naming the output files.
         self.file_counter = 1  
-        self.path_to_output_json = "output.json"
-        self.path_to_output_txt = "output.txt"
+        # "json" writes an indented JSON array, "jsonl" one question per line.
+        self.output_format = output_format
+        # Directory all outputs (output.*, data/, packages) are written to; "" is the CWD.
+        self.output_dir = output_dir
+        self.path_to_output_json = self.output_path(f"output.{output_format}")
+        self.path_to_output_txt = self.output_path("output.txt")
+        self.control_file = h5p_parser.CONTROL_FILE
         self.data = None
         self.precision = 0
+        # Master seed of the entry points that are not given one (see question_seed);
+        # None draws fresh seeds.
+        self.seed = seed
+        # Evaluate answers through a lambdified callable instead of subs/doit/evalf.
+        self.compile_expressions = compile_expressions
+        # Solve Eq(...) questions once for the unknown and reuse the closed form.
+        self.solve_equations_once = solve_equations_once
+        # Render formulas through a per-expression LatexTemplate instead of sp.latex.
+        self.template_latex = template_latex
+        self.latex_templates = {}
+        # Keep the compiled answers and the final-set pools of the most recent question specs
+        # in memory (see compile_question and question_pool), for long-running processes that
+        # generate the same questions again and again.
+        self.keep_compiled = keep_compiled
+        self.compiled_questions = util.LRUCache(COMPILED_CACHE_SIZE)
+        self.parameter_spaces = util.LRUCache(COMPILED_CACHE_SIZE)
+        self.question_pools = util.LRUCache(POOL_CACHE_SIZE)
+        # Draw parameter tuples without replacement and drop variants that render identically.
+        self.unique_variants = unique_variants
+        # Per-variant time budget (seconds) for symbolic evaluation; None means unbounded.
+        # Bounded evaluations run in an IsolatedEvaluator that is killed on timeout.
+        self.timeout = timeout
+        # Timed-out variants redrawn per question before the question is given up.
+        self.max_retries = max_retries
+        # Replace wrong answers that show the same value as the correct answer or another
+        # wrong answer; variants that cannot be repaired are redrawn, at most
+        # collision_retries times per requested variant.
+        self.reject_collisions = reject_collisions
+        self.collision_retries = collision_retries
+        self.evaluator = None
+        self.deadline = None
+        # Shared sympify cache; with a directory, parsed expressions persist across runs.
+        self.parse_cache_dir = parse_cache_dir
+        self.parse_cache = parse_cache.cache_for(parse_cache_dir)
+        # Per-stage counters and timings (see instrumentation.Profiler); trace also keeps
+        # every event for write_trace. Disabled, every stage is a shared no-op.
+        self.profile = profile or trace
+        self.trace = trace
+        self.profiler = instrumentation.Profiler(trace) if self.profile else instrumentation.NULL
+        # With a directory, the variants of every question are stored by a hash of its spec
+        # and reused while the spec is unchanged (see pool_cache.PoolCache).
+        self.pool_cache_dir = pool_cache_dir
+        self.pool_cache = pool_cache.PoolCache(pool_cache_dir) if pool_cache_dir is not None else None
 
-    def save_to_file(self, data):
-        def default_converter(obj):
-            if isinstance(obj, sp.Integer):
-                return int(obj)
-            elif isinstance(obj, sp.Rational):
-                return f"{obj.p}/{obj.q}"
-            return str(obj)
-
-        with open(self.path_to_output_json, 'w') as f:
-            json_data = json.dumps(data, indent=4, default=default_converter)
-            # Replace double backslashes with a single backslash
-            # json_data = json_data.replace('\\\\', '\\')
-            f.write(json_data)
-
-    def save_to_txt(self, questions):
-        lines = []
-        for idx, q in enumerate(questions, start=1):
-            # The question_text already includes the evaluated formula wrapped in \[ \]
-            question_text = q.get("question_text")
-            if q.get("wrong_answers"):
-                header = f"MCQ: {idx}. {question_text}"
-                lines.append(header.replace('\\\\', '\\'))
-                lines.append(f"*{q.get('correct_answer')}")
-                for wa in q.get("wrong_answers"):
-                    lines.append(f"{wa}")
-            else:
-                header = f"FIB: {idx}. {question_text} = *{q.get('correct_answer')}*"
-                lines.append(header.replace('\\\\', '\\'))
-            lines.append("")
+    def output_path(self, *parts):
+        return os.path.join(self.output_dir, *parts)
 
-        with open(self.path_to_output_txt, 'w') as f:
-            f.write("\n".join(lines))
+    def save_outputs(self, questions):
+        """
+        Writes the questions to the JSON (or JSONL) and TXT outputs in a single pass,
+        so a generator of questions is never held in memory as a whole.
+        Returns the number of questions written.
+        """
+        targets = [writers.json_writer(self.path_to_output_json, self.output_format)]
+        # A "pool" file replaces both; its JSON and TXT are exported on demand (see export_outputs).
+        if self.output_format != "pool":
+            targets.append(writers.TxtWriter(self.path_to_output_txt))
+        try:
+            for question in questions:
+                with self.profiler.stage("write"):
+                    for writer in targets:
+                        writer.write(question)
+        finally:
+            for writer in targets:
+                writer.close()
+        return targets[0].count
 
-    def generate_h5p(self, h5p_id=""):
+    def export_outputs(self, output_format="json"):
         """
-        Generates a single H5P file from self.path_to_output_txt using the txt2h5p parser.
-        After generation, renames the file by appending h5p_id to the base name.
+        Exports the current "pool" output to a JSON file of output_format ("json" or
+        "jsonl") next to it and to self.path_to_output_txt. Returns the question count.
         """
-        h5p_parser.generate("./backend/txt2h5p/control.txt", self.path_to_output_txt)
+        json_path = os.path.splitext(self.path_to_output_json)[0] + f".{output_format}"
+        return pool_store.export(self.path_to_output_json, json_path, self.path_to_output_txt, output_format)
 
-    def randomize_parameters(self, parameters):
-        if not parameters:
-            return {}
+    def generate_h5p(self, h5p_id="", questions_file=None):
+        """
+        Generates a single H5P file from questions_file (self.path_to_output_txt by
+        default) using the txt2h5p parser. The file is named after NAME_H5P from the
+        control file, with h5p_id appended to the base name. Returns its path.
+        """
+        self.profiler.set_question("h5p")
+        if questions_file is None and self.output_format == "pool":
+            with self.profiler.stage("export"):
+                pool_store.export(self.path_to_output_json, txt_path=self.path_to_output_txt)
+        return _generate_h5p_job((self.control_file, questions_file or self.path_to_output_txt, h5p_id, self.output_dir),
+                                 self.profiler)
 
-        randomized_params = {}
-        for param in parameters:
-            param_name = param.get('name')
-            if not param_name:
-                continue
+    def parameter_space(self, data, warn=True):
+        """
+        Returns the sampling.ParameterSpace of a question (its parameters restricted by
+        its "constraints") and, with unique_variants, warns when it holds fewer distinct
+        variants than randomization_count asks for. With keep_compiled the space is kept
+        per spec, so its constraints are only enumerated once.
+        """
+        parameters = data.get("parameters", [])
+        constraints = data.get("constraints")
+        key = None
+        space = None
+        if self.keep_compiled:
+            key = json.dumps([parameters, constraints], sort_keys=True, default=str)
+            space = self.parameter_spaces.get(key)
+        if space is None:
+            with self.profiler.stage("constraints"):
+                space = sampling.ParameterSpace(parameters, constraints)
+            if key is not None:
+                self.parameter_spaces[key] = space
+        randomization_count = data.get("randomization_count", 1)
+        if warn and self.unique_variants and randomization_count > space.size:
+            util.logger.warning(f"{data.get('latex_question', '')}: randomization_count is {randomization_count}, "
+                                f"but the parameters only allow {space.size} distinct variants")
+        return space
 
-            try:
-                range_from = int(param.get('range_from', 0))
-                range_to = int(param.get('range_to', 0))
-                excluding = int(param.get('excluding', None)) if param.get('excluding') is not None else None
-                step = int(param.get('step', 1))
-            except (ValueError, TypeError):
-                continue
+    def report_sampling(self, data, space, drawn, pruned):
+        """
+        Logs the acceptance rate of the constraints of a question: the share of the
+        parameter space they admit when it was enumerated, else the share of the drawn
+        tuples that passed them.
+        """
+        if not space.constrained:
+            return
+        latex_question = data.get('latex_question', '')
+        acceptance = space.acceptance()
+        if acceptance is not None:
+            util.logger.info(f"{latex_question}: the constraints admit {space.size} of {space.total} "
+                             f"parameter tuples ({acceptance:.1%})")
+        elif drawn:
+            util.logger.info(f"{latex_question}: the constraints accepted {drawn - pruned} of {drawn} "
+                             f"drawn parameter tuples ({(drawn - pruned) / drawn:.1%})")
+
+    def report_variants(self, data, produced, duplicates, timeouts, collisions=0, rejected=0, pruned=0,
+                        drawn=None, size=None):
+        """
+        Logs how many rendered duplicates, timed-out variants and variants with colliding
+        wrong answers were dropped, how many wrong answers were replaced, and why a
+        question came up short of randomization_count. The batch path passes how many of
+        the size parameter tuples it drew; the rows it drops are not redrawn.
+        """
+        latex_question = data.get('latex_question', '')
+        if duplicates:
+            util.logger.info(f"{latex_question}: skipped {duplicates} variants identical to an earlier one")
+        if timeouts:
+            util.logger.warning(f"{latex_question}: {timeouts} variants exceeded the {self.timeout}s time budget")
+        if collisions:
+            util.logger.info(f"{latex_question}: replaced {collisions} wrong answers equal to the correct answer "
+                             f"or to another wrong answer")
+        if rejected:
+            rate = rejected / (produced + duplicates + timeouts + rejected)
+            util.logger.warning(f"{latex_question}: rejected {rejected} variants ({rate:.1%}) whose wrong answers "
+                                f"could not be made distinct")
+        requested = data.get("randomization_count", 1)
+        if produced < requested:
+            if timeouts > self.max_retries:
+                reason = "too many evaluations timed out"
+            elif rejected > self.collision_retries * requested:
+                reason = "too many variants had colliding wrong answers"
+            elif duplicates > sampling.REJECTION_LIMIT * requested:
+                reason = "too many variants were identical to an earlier one; the question renders few distinct variants"
+            elif drawn is not None and size and (drawn < size or not self.unique_variants):
+                dropped = duplicates + timeouts + rejected + pruned
+                constrained = f" ({pruned} rejected by the constraints)" if pruned else ""
+                reason = (f"the batch dropped {dropped} of its {drawn} rows{constrained} and draws no "
+                          f"replacements; run without --batch to fill it")
+            elif pruned:
+                reason = (f"the constraints rejected {pruned} drawn parameter tuples; they are too sparse to "
+                          f"sample this parameter space, narrow the parameter ranges")
+            else:
+                reason = "the parameter space is exhausted"
+            util.logger.warning(f"{latex_question}: generated only {produced} of {requested} variants, {reason}")
+
+    def start_budget(self):
+        """
+        Starts the time budget of one variant (see bounded).
+        """
+        self.deadline = time.monotonic() + self.timeout if self.timeout is not None else None
 
-            param_values = [i for i in range(range_from, range_to + 1, step)
-                            if excluding is None or i != excluding]
-            if param_values:
-                randomized_params[param_name] = random.choice(param_values)
-        return randomized_params
+    def bounded(self, method, *args):
+        """
+        Calls one of this instance's evaluation methods. With a timeout set the call runs
+        in the isolated evaluator with whatever is left of the current budget, and
+        raises evaluator.EvaluationTimeout when it runs out.
+        """
+        if self.timeout is None:
+            return getattr(self, method)(*args)
+        if self.evaluator is None:
+            self.evaluator = evaluator.IsolatedEvaluator(self.worker_settings())
+        if self.deadline is None:
+            self.start_budget()
+        with self.profiler.stage("isolated"):
+            return self.evaluator.call(method, args, self.precision, self.deadline - time.monotonic())
+
+    def close_evaluator(self):
+        if self.evaluator is not None:
+            self.evaluator.close()
+            self.evaluator = None
 
     def auto_evaluate_expression(self, expr, randomized_params):
-        substituted = expr.subs(randomized_params)
+        with self.profiler.stage("subs"):
+            substituted = expr.subs(randomized_params)
 
         if isinstance(substituted, (list, tuple)):
-            solutions = sp.solve(substituted, dict=True)
+            with self.profiler.stage("solve"):
+                solutions = sp.solve(substituted, dict=True)
             return solutions
 
         if isinstance(substituted, sp.Equality):
-            solutions = sp.solve(substituted, dict=False)
+            with self.profiler.stage("solve"):
+                solutions = sp.solve(substituted, dict=False)
             return solutions
 
         try:
-            temp = substituted.doit()
+            with self.profiler.stage("doit"):
+                temp = substituted.doit()
         except (AttributeError, TypeError):
             temp = substituted
 
         if isinstance(temp, sp.Equality):
-            solutions = sp.solve(temp, dict=False)
+            with self.profiler.stage("solve"):
+                solutions = sp.solve(temp, dict=False)
             return solutions
 
-        return temp.evalf()
+        with self.profiler.stage("evalf"):
+            return temp.evalf()
 
     def evaluate_expression(self, expr, randomized_params):
         result = self.auto_evaluate_expression(expr, randomized_params)
 
         if isinstance(result, list):
             if len(result) == 1 and isinstance(result[0], (sp.Expr, int, float)):
-                numeric_value = result[0].evalf()
+                with self.profiler.stage("evalf"):
+                    numeric_value = result[0].evalf()
             else:
                 numeric_value = result
         elif isinstance(result, dict):
             numeric_value = result
         elif isinstance(result, sp.Expr):
-            numeric_value = result.evalf()
+            with self.profiler.stage("evalf"):
+                numeric_value = result.evalf()
         else:
             numeric_value = result
 
+        value = self.format_value(numeric_value)
+        # Solution lists and symbolic results are kept as the text the TXT shows, so a
+        # pool reloaded from JSON (cache, .pool file) writes the same TXT again.
+        return value if isinstance(value, (int, float)) else str(value)
+
+    def format_value(self, numeric_value):
+        """
+        Rounds a numeric answer to the configured precision (or truncates it to an
+        integer when no precision is set). Non-numeric values are returned as is.
+        """
         try:
             numeric_value = float(numeric_value)
             if self.precision > 0:
@@ -136,61 +356,378 @@ class Logic:
 
         return numeric_value
 
-    def process_correct_answer(self, correct_answer_data, latex_question, randomized_params):
+    def correct_answer_expression(self, correct_answer_data, latex_question):
+        with self.profiler.stage("sympify"):
+            if correct_answer_data['answer_mode'] == 'function':
+                func_val = correct_answer_data['function']
+                return self.parse_cache.sympify(func_val) if isinstance(func_val, str) else func_val
+            return self.parse_cache.sympify(latex_question)
+
+    def numeric_form(self, expr, parameter_names):
+        """
+        Evaluates the expression once with the parameters kept symbolic. Equations are
+        replaced by their closed-form solution (see solve_symbolically). Returns the
+        parameter symbols and the resulting expression, or None when the expression
+        has no closed form in the parameters (unevaluated integrals/limits, unknown
+        symbols, ...), in which case the symbolic path has to be used.
+        """
+        if not self.compile_expressions or not isinstance(expr, sp.Basic):
+            return None
+
+        try:
+            evaluated = expr.doit()
+        except (AttributeError, TypeError, ValueError, NotImplementedError):
+            return None
+
+        symbols = [sp.Symbol(name) for name in parameter_names]
+        if isinstance(evaluated, sp.Equality):
+            evaluated = self.solve_symbolically(evaluated, symbols)
+
+        if not isinstance(evaluated, sp.Expr) or evaluated.has(*UNEVALUATED_TYPES):
+            return None
+
+        if not evaluated.free_symbols <= set(symbols):
+            return None
+
+        return symbols, evaluated
+
+    def compile_expression(self, expr, parameter_names, modules="math", form=None):
+        """
+        Turns the numeric form of the expression into a callable taking the parameter
+        values in the order of parameter_names (scalars for the "math" module, arrays
+        for "numpy"). Returns None when the expression cannot be compiled.
+        """
+        if form is None:
+            form = self.numeric_form(expr, parameter_names)
+        if form is None:
+            return None
+
+        symbols, evaluated = form
+        try:
+            return sp.lambdify(symbols, evaluated, modules=modules)
+        except Exception as e:
+            util.logger.debug(f"Could not compile {expr}: {e}")
+            return None
+
+    def solve_symbolically(self, equation, parameter_symbols):
+        """
+        Solves the equation once for its single unknown, keeping the parameters as
+        symbols. Only equations that are linear in the unknown are solved this way:
+        their solution has the same form for every parameter set, and the variants
+        where the leading coefficient vanishes fail in the compiled callable and fall
+        back to solving per variant. Returns None when no such closed form exists.
+        """
+        if not self.solve_equations_once:
+            return None
+
+        unknowns = equation.free_symbols - set(parameter_symbols)
+        if len(unknowns) != 1:
+            return None
+        unknown = unknowns.pop()
+
+        difference = equation.lhs - equation.rhs
+        try:
+            if not difference.is_polynomial(unknown) or sp.degree(difference, unknown) != 1:
+                return None
+            solutions = sp.solve(equation, unknown)
+        except (NotImplementedError, sp.PolynomialError):
+            return None
+
+        if len(solutions) != 1 or solutions[0].has(sp.Piecewise):
+            return None
+        return solutions[0]
+
+    def compile_correct_answer(self, correct_answer_data, latex_question, parameters):
+        """
+        Parses the correct answer expression once per question and compiles it.
+        The returned dict is passed to process_correct_answer for every variant.
+        """
+        expr = self.correct_answer_expression(correct_answer_data, latex_question)
+        parameter_names = [param.get('name') for param in parameters if param.get('name')]
+        with self.profiler.stage("compile"):
+            form = self.bounded_numeric_form(expr, parameter_names)
+            compiled_func = self.compile_expression(expr, parameter_names, form=form) if form is not None else None
+        return {
+            'expr': expr,
+            'parameter_names': parameter_names,
+            'form': form,
+            'evaluator': compiled_func
+        }
+
+    def bounded_numeric_form(self, expr, parameter_names):
+        """
+        numeric_form under the time budget; an expression that cannot be simplified in
+        time gets no numeric form and is evaluated per variant instead.
+        """
+        self.start_budget()
+        try:
+            return self.bounded('numeric_form', expr, parameter_names)
+        except evaluator.EvaluationTimeout as e:
+            util.logger.warning(f"Could not simplify {expr} within the time budget ({e}), evaluating per variant")
+            return None
+
+    def compiled_value(self, compiled, randomized_params):
+        """
+        The formatted value of a compiled expression for one set of parameter values,
+        or None when there is no callable or it fails (division by zero, complex
+        results, missing parameters, functions unknown to the math module, ...).
+        """
+        evaluator = compiled['evaluator']
+        if evaluator is None:
+            return None
+        try:
+            with self.profiler.stage("evaluate_compiled"):
+                value = evaluator(*[randomized_params[name] for name in compiled['parameter_names']])
+            value = float(value)
+        except Exception:
+            return None
+        if not math.isfinite(value):
+            return None
+        # evalf() works with 15 significant digits; snapping to them keeps
+        # float noise (2.9999999999999996) from changing the truncated answer.
+        return self.format_value(float(f"{value:.15g}"))
+
+    def evaluate_compiled(self, compiled, randomized_params):
+        """
+        Evaluates a compiled expression for one set of parameter values, falling back
+        to the symbolic path when the callable fails (see compiled_value).
+        """
+        value = self.compiled_value(compiled, randomized_params)
+        if value is not None:
+            return value
+        return self.bounded('evaluate_expression', compiled['expr'], randomized_params)
+
+    def process_correct_answer(self, correct_answer_data, latex_question, randomized_params, compiled=None):
         """
         Stores the original function after substitution and its evaluated answer.
         The 'original_formula' is stored in LaTeX format exactly as given.
+        When a compiled answer (see compile_correct_answer) is given, the expression is
+        not parsed again and the value comes from the compiled callable.
         """
-        if correct_answer_data['answer_mode'] == 'function':
-            func_val = correct_answer_data['function']
-            expr = sp.sympify(func_val) if isinstance(func_val, str) else func_val
+        if compiled is None:
+            expr = self.correct_answer_expression(correct_answer_data, latex_question)
         else:
-            expr = sp.sympify(latex_question)
+            expr = compiled['expr']
 
-        substituted_expr = expr.subs(randomized_params)
-        original_formula_latex = sp.latex(substituted_expr)
-        evaluated_value = self.evaluate_expression(expr, randomized_params)
+        original_formula_latex = self.render_latex(expr, randomized_params)
+        if compiled is None:
+            evaluated_value = self.bounded('evaluate_expression', expr, randomized_params)
+        else:
+            evaluated_value = self.evaluate_compiled(compiled, randomized_params)
 
         return {
             'correct_answer': evaluated_value,
             'original_formula': original_formula_latex
         }
 
-    def process_wrong_answers(self, wrong_answers, randomized_params, answer_number):
-        wrong_options = []
+    def render_latex(self, expr, randomized_params, substituted_expr=None):
+        """
+        sp.latex of expr with randomized_params substituted. With template_latex the
+        expression's LatexTemplate fills in the values instead of printing the tree;
+        substituted_expr, when the caller already substituted, is used on a fallback.
+        Expressions that are not SymPy Basic objects (mutable matrices) are unhashable
+        and are always printed with sp.latex.
+        """
+        if not self.template_latex or not isinstance(expr, sp.Basic):
+            if substituted_expr is None:
+                with self.profiler.stage("subs"):
+                    substituted_expr = expr.subs(randomized_params)
+            with self.profiler.stage("latex"):
+                return sp.latex(substituted_expr)
+
+        key = (expr, tuple(randomized_params))
+        template = self.latex_templates.get(key)
+        if template is None:
+            template = self.latex_templates[key] = latex_template.LatexTemplate(expr, randomized_params)
+        with self.profiler.stage("latex"):
+            return template.render(randomized_params, substituted_expr)
+
+    def process_wrong_answer(self, wrong_item, randomized_params):
+        try:
+            with self.profiler.stage("sympify"):
+                wrong_expr = self.parse_cache.sympify(wrong_item)
+            with self.profiler.stage("subs"):
+                substituted_expr = wrong_expr.subs(randomized_params)
+            evaluated_val = self.evaluate_expression(substituted_expr, randomized_params)
+            original_wrong_expr_latex = self.render_latex(wrong_expr, randomized_params, substituted_expr)
+            return {
+                "value": str(evaluated_val),
+                "formula": original_wrong_expr_latex
+            }
+        except (sp.SympifyError, TypeError, ValueError):
+            return {
+                "value": wrong_item,
+                "formula": wrong_item
+            }
+
+    def compile_question(self, data):
+        """
+        Compiles the correct answer and the wrong answers of a question spec (see
+        compile_correct_answer and compile_wrong_answers). Returns the compiled answer
+        and the wrong options, or None for the options when the question has no wrong
+        answers. With keep_compiled the result is kept per spec and reused.
+        """
+        parameters = data.get("parameters", [])
+        wrong_answers = data.get("wrong_answers", None)
+        key = None
+        if self.keep_compiled:
+            key = json.dumps([data.get("latex_question", ""), data.get("correct_answer", {}), parameters,
+                              wrong_answers], sort_keys=True, default=str)
+            if key in self.compiled_questions:
+                return self.compiled_questions[key]
+
+        compiled = self.compile_correct_answer(data.get("correct_answer", {}), data.get("latex_question", ""),
+                                               parameters)
+        wrong_options = self.compile_wrong_answers(wrong_answers, compiled['parameter_names']) if wrong_answers else None
+        if key is not None:
+            self.compiled_questions[key] = (compiled, wrong_options)
+        return compiled, wrong_options
+
+    def compile_wrong_answers(self, wrong_answers, parameter_names, modules="math"):
+        """
+        Sorts the wrong answers of a question once into static text (items that do not
+        parse) and formulas, which are compiled like the correct answer (see
+        compile_correct_answer; modules="numpy" leaves compiling to the caller).
+        Returns one option dict per item, in order, for process_wrong_answers.
+        """
+        options = []
         for wrong_item in wrong_answers:
             try:
-                wrong_expr = sp.sympify(wrong_item)
-                substituted_expr = wrong_expr.subs(randomized_params)
-                evaluated_val = self.evaluate_expression(substituted_expr, randomized_params)
-                original_wrong_expr_latex = sp.latex(substituted_expr)
-                wrong_options.append({
-                    "value": str(evaluated_val),
-                    "formula": original_wrong_expr_latex
-                })
+                with self.profiler.stage("sympify"):
+                    wrong_expr = self.parse_cache.sympify(wrong_item)
             except (sp.SympifyError, TypeError, ValueError):
-                wrong_options.append({
-                    "value": wrong_item,
-                    "formula": wrong_item
-                })
+                options.append({'item': wrong_item, 'text': {"value": wrong_item, "formula": wrong_item}})
+                continue
+            with self.profiler.stage("compile"):
+                form = self.bounded_numeric_form(wrong_expr, parameter_names)
+                compiled_func = self.compile_expression(wrong_expr, parameter_names, form=form) \
+                    if form is not None and modules == "math" else None
+            options.append({
+                'item': wrong_item,
+                'text': None,
+                'expr': wrong_expr,
+                'parameter_names': parameter_names,
+                'form': form,
+                'evaluator': compiled_func
+            })
+        return options
+
+    def process_wrong_option(self, option, randomized_params):
+        """
+        The value of one option of compile_wrong_answers and a callable returning its
+        formula, so the formula is only rendered for options that are kept. Formulas
+        whose compiled callable fails go through process_wrong_answer.
+        """
+        if option['text'] is not None:
+            return option['text']["value"], lambda: option['text']["formula"]
+        value = self.compiled_value(option, randomized_params)
+        if value is None:
+            processed = self.bounded('process_wrong_answer', option['item'], randomized_params)
+            return processed["value"], lambda: processed["formula"]
+        return str(value), lambda: self.render_latex(option['expr'], randomized_params)
+
+    def answer_key(self, value):
+        """
+        What a value shows to the student: numbers at the configured precision (see
+        format_value), anything else as its text. Equal keys are collisions.
+        """
+        try:
+            return self.format_value(float(value))
+        except (TypeError, ValueError):
+            return str(value).strip()
+
+    def variant_key(self, question_text, correct_answer):
+        """
+        A fixed-size digest of a variant's question text and correct answer. Equal keys
+        are duplicate variants; the seen set of a streamed run stays small per variant.
+        """
+        text = f"{question_text}\0{correct_answer}".encode("utf-8")
+        return hashlib.blake2b(text, digest_size=16).digest()
+
+    def pick_wrong_options(self, order, keep, correct_answer, evaluate):
+        """
+        Walks the option indices of order and keeps the first keep of them. With
+        reject_collisions an option is skipped when its value collides with the correct
+        answer or with a kept option, and the next index takes its place.
+        evaluate(index) returns the value of an option and a callable for its formula.
+        Returns the kept values, their formulas and the number of skipped options, or
+        None when fewer than keep distinct options exist.
+        """
+        values = []
+        formulas = []
+        skipped = 0
+        seen = {self.answer_key(correct_answer)}
+        order = iter(order)
+        while len(values) < keep:
+            # The next index is only taken when a slot is still open, so a lazy order
+            # draws its replacements only after a collision.
+            index = next(order, None)
+            if index is None:
+                return None
+            value, formula = evaluate(index)
+            if self.reject_collisions:
+                key = self.answer_key(value)
+                if key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+            values.append(value)
+            formulas.append(formula)
+        return values, [formula() for formula in formulas], skipped
+
+    def process_wrong_answers(self, wrong_options, randomized_params, answer_number, correct_answer=None,
+                              key=0, index=0):
+        """
+        Draws answer_number of the options of compile_wrong_answers (all of them when
+        it is not positive) and evaluates and renders only the drawn ones. Options that
+        collide with correct_answer or with each other are replaced by further random
+        options (see pick_wrong_options). The order of the options is the one of draw
+        index in the stream key, as in iter_batch. Returns the values, the formulas and
+        the number of replaced options, or None when the variant has to be redrawn.
+        """
+        keep, order = vectorized.choose_wrong_options(len(wrong_options), answer_number,
+                                                      sampling.uniforms(key, [index], len(wrong_options)))
+        return self.pick_wrong_options(order[0].tolist(), keep, correct_answer,
+                                       lambda i: self.process_wrong_option(wrong_options[i], randomized_params))
 
-        if answer_number is None or answer_number <= 0:
-            answer_number = len(wrong_options)
+    def generate_question(self, data, seed=None, batch=False):
+        return list(self.iter_question(data, seed, batch))
 
-        final_wrong_options = random.sample(wrong_options, min(answer_number, len(wrong_options)))
-        final_wrong_values = [opt["value"] for opt in final_wrong_options]
-        final_wrong_formulas = [opt["formula"] for opt in final_wrong_options]
-        return final_wrong_values, final_wrong_formulas
+    def generate_variant(self, data, seed, index):
+        """
+        Regenerates the single variant of a question that iter_question(data, seed)
+        produced from draw index (the "variant" field of its output), without drawing
+        the others. Returns None when that draw does not make a variant (its wrong
+        answers cannot be repaired, or it timed out); with unique_variants an index
+        beyond the parameter space raises IndexError.
+        """
+        variants = list(self.iter_question({**data, "randomization_count": 1}, seed, indices=[index]))
+        return variants[0] if variants else None
 
-    def perform_logic(self, data):
+    def stream_keys(self, seed):
         """
-        Processes a single question dictionary.
+        The keys of the parameter and wrong-answer streams of a question seed.
+        """
+        return sampling.stream_key(seed, "parameters"), sampling.stream_key(seed, "wrong_answers")
+
+    def iter_question(self, data, seed=None, batch=False, indices=None):
+        """
+        Yields the randomized variants of a single question dictionary.
         Expects data to include:
          - "question_text": the full text with the original bracketed LaTeX.
          - "formula_index" and "formula_length" to locate the LaTeX expression.
          - "latex_question": the extracted LaTeX expression.
+        Every random choice of the variant of draw index j depends only on (seed, j)
+        (see sampling), so the same (data, seed) always gives the same variants and each
+        of them can be regenerated alone (see generate_variant); seed=None draws a fresh
+        seed. indices restricts the draws to those indices; the variants of explicit
+        indices are neither limited nor reported like a question's pool.
+        With unique_variants the parameter tuples are drawn without replacement and a
+        variant whose text and correct answer repeat an earlier one is skipped, so fewer
+        than randomization_count variants are yielded when the space runs out.
         """
         self.data = data
+        self.profiler.set_question(data.get("latex_question", ""))
         raw_question_text = data.get("question_text", "")
         formula_index = data.get("formula_index", None)
         formula_length = data.get("formula_length", 0)
@@ -201,6 +738,14 @@ class Logic:
             self.precision = precision if precision > 0 else 0
         except (TypeError, ValueError):
             util.logger.error(f"Invalid precision value: {data.get('precision')}")
+            self.precision = 0
+
+        if seed is None:
+            seed = random.getrandbits(64)
+        parameter_key, wrong_key = self.stream_keys(seed)
+        if batch and indices is None:
+            yield from self.iter_batch(data, seed)
+            return
 
         parameters = data.get("parameters", [])
         correct_answer_data = data.get("correct_answer", {})
@@ -208,10 +753,33 @@ class Logic:
         answer_number = data.get("answer_number", 0)
         randomization_count = data.get("randomization_count", 1)
 
-        random_questions = []
-        for i in range(randomization_count):
-            randomized_params = self.randomize_parameters(parameters)
-            correct_data = self.process_correct_answer(correct_answer_data, latex_question, randomized_params)
+        compiled, wrong_options = self.compile_question(data)
+        if randomization_count < 1:
+            return
+        space = self.parameter_space(data)
+        explicit = indices is not None
+        if not explicit:
+            indices = range(space.size) if self.unique_variants or not space.size else itertools.count()
+        draws = ((index, space.draw(index, parameter_key, self.unique_variants)) for index in indices)
+
+        seen = set()
+        produced = duplicates = timeouts = collisions = rejected = drawn = pruned = 0
+        for index, randomized_params in self.profiler.timed("sample", draws):
+            drawn += 1
+            # Constraints too costly to enumerate are checked before anything is evaluated.
+            if space.checks and not space.admits(randomized_params):
+                pruned += 1
+                if not explicit and pruned > sampling.REJECTION_LIMIT * randomization_count:
+                    break
+                continue
+            self.start_budget()
+            try:
+                correct_data = self.process_correct_answer(correct_answer_data, latex_question, randomized_params, compiled)
+            except evaluator.EvaluationTimeout as e:
+                timeouts += 1
+                if not self.retry_after_timeout(data, randomized_params, e, timeouts):
+                    break
+                continue
             # Replace the original bracketed formula with evaluated formula wrapped in \[ and \]
             if formula_index is not None:
                 final_question_text = (raw_question_text[:formula_index] +
@@ -220,8 +788,15 @@ class Logic:
             else:
                 final_question_text = raw_question_text
 
+            key = self.variant_key(final_question_text, correct_data['correct_answer'])
+            if self.unique_variants and key in seen:
+                duplicates += 1
+                if not explicit and duplicates > sampling.REJECTION_LIMIT * randomization_count:
+                    break
+                continue
+
             question_dict = {
-                'identifier': i + 1,
+                'variant': index,
                 'question_text': final_question_text,
                 'randomized_params': randomized_params,
                 'correct_answer': correct_data['correct_answer'],
@@ -229,124 +804,522 @@ class Logic:
             }
 
             if wrong_answers:
-                wrong_vals, wrong_formulas = self.process_wrong_answers(wrong_answers, randomized_params, answer_number)
+                try:
+                    picked = self.process_wrong_answers(wrong_options, randomized_params, answer_number,
+                                                        correct_data['correct_answer'], wrong_key, index)
+                except evaluator.EvaluationTimeout as e:
+                    timeouts += 1
+                    if not self.retry_after_timeout(data, randomized_params, e, timeouts):
+                        break
+                    continue
+                if picked is None:
+                    rejected += 1
+                    if not explicit and rejected > self.collision_retries * randomization_count:
+                        break
+                    continue
+                wrong_vals, wrong_formulas, replaced = picked
+                collisions += replaced
                 question_dict['wrong_answers'] = wrong_vals
                 question_dict['wrong_formulas'] = wrong_formulas
             else:
                 question_dict['wrong_answers'] = []
                 question_dict['wrong_formulas'] = []
 
-            random_questions.append(question_dict)
+            if self.unique_variants:
+                seen.add(key)
+            yield question_dict
+            produced += 1
+            if produced == randomization_count:
+                break
 
-        self.path_to_output_json = f"data/output{self.file_counter}.json"
-        self.path_to_output_txt = f"data/output{self.file_counter}.txt"
+        if not explicit:
+            self.report_sampling(data, space, drawn, pruned)
+            self.report_variants(data, produced, duplicates, timeouts, collisions, rejected, pruned)
 
-        os.makedirs("data", exist_ok=True)
-        self.save_to_file(random_questions)
-        self.save_to_txt(random_questions)
-        self.file_counter += 1
+    def retry_after_timeout(self, data, randomized_params, error, timeouts):
+        """
+        Reports a variant that ran out of time. Returns True while the question may go on
+        with other parameters, False once max_retries is exceeded.
+        """
+        latex_question = data.get('latex_question', '')
+        if timeouts > self.max_retries:
+            util.logger.error(f"{latex_question}: giving up after {timeouts} timed-out variants ({error})")
+            return False
+        util.logger.warning(f"{latex_question}: skipped variant {randomized_params}, {error}")
+        return True
+
+    def track(self, items, total, progress=None, cancel=None):
+        """
+        Passes items through, calling progress(done, total) after each one and raising
+        GenerationCancelled as soon as the cancel event (a threading.Event) is set.
+        """
+        for done, item in enumerate(items, 1):
+            yield item
+            if progress is not None:
+                progress(done, total)
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+
+    def perform_logic(self, data, seed=None, progress=None, cancel=None):
+        """
+        Processes a single question dictionary (see generate_question) and writes the
+        variants to the next data/output<n>.json/.txt pair, which numbers them.
+        Without a seed, the question gets the seed of its position under the master
+        seed (see question_seed). See track for progress and cancel; a cancelled run
+        writes nothing.
+        """
+        if seed is None:
+            seed = self.question_seed(self.file_counter - 1)
+        variants = self.track(self.iter_question(data, seed), data.get("randomization_count", 1), progress, cancel)
+        random_questions = list(variants)
+        self.save_pool(random_questions)
         return random_questions
 
-    def generate_final_h5p_set(self, times=1):
-        """
-        Gathers one random question from each output*.json, writes them to finalOutput_i.json/.txt,
-        and calls the H5P generator 'times' times.
-        """
-        for i in range(times):
-            final_questions = []
-            for filename in sorted(glob.glob("data/output*.json"), 
-                                   key=lambda x: int(''.join(filter(str.isdigit, x))) or 0):
-                with open(filename, 'r') as f:
-                    questions = json.load(f)
-                if questions:
-                    final_questions.append(random.choice(questions))
-
-            final_json = f"data/final/finalOutput_{i+1}.json"
-            final_txt = f"data/final/finalOutput_{i+1}.txt"
-            os.makedirs("data/final", exist_ok=True)
-            
-            with open(final_json, 'w') as f:
-                json.dump(final_questions, f, indent=4)
-
-            lines = []
-            for idx, q in enumerate(final_questions, start=1):
-                # The question_text already contains the evaluated formula
-                question_text = q.get("question_text")
-                if q.get("wrong_answers"):
-                    header = f"MCQ: {idx}. {question_text}"
-                    lines.append(header)
-                    lines.append(f"*{q.get('correct_answer')}")
-                    for wa in q.get("wrong_answers"):
-                        lines.append(f"{wa}")
-                else:
-                    header = f"FIB: {idx}. {question_text} = *{q.get('correct_answer')}*"
-                    lines.append(header)
-                lines.append("")
+    def save_pool(self, questions):
+        """
+        Numbers the variants of one question and writes them to the next
+        data/output<n>.json/.txt pair. questions may be a generator; it is streamed.
+        Returns the number of variants written.
+        """
+        self.path_to_output_json = self.output_path("data", f"output{self.file_counter}.{self.output_format}")
+        self.path_to_output_txt = self.output_path("data", f"output{self.file_counter}.txt")
 
-            with open(final_txt, 'w') as f:
-                f.write("\n".join(lines))
+        os.makedirs(self.output_path("data"), exist_ok=True)
+        count = self.save_outputs(self.number_questions(questions))
+        self.file_counter += 1
+        return count
 
-            self.path_to_output_txt = final_txt
-            self.generate_h5p(h5p_id=i+1)
-            util.logger.info(f"Generated final H5P set #{i+1} -> {final_json}, {final_txt}")
+    def number_questions(self, questions):
+        """
+        Yields the variants of one question with their 1-based 'identifier' first, as
+        they are stored in a pool.
+        """
+        for i, question in enumerate(questions):
+            yield {'identifier': i + 1, **question}
 
-    def perform_logic_all(self, data_list):
+    def load_output_pools(self):
         """
-        Processes a list of question dictionaries.
-        For each question, performs the required number of randomizations,
-        aggregates all questions, and writes them to output files.
+        Reads every non-empty data/output*.json(l) once, in file-number order, and
+        returns the question pools as a list of lists. .pool files are memory-mapped
+        and only the drawn questions are decoded.
+        """
+        filenames = sorted(glob.glob(self.output_path("data", "output*.json")) +
+                           glob.glob(self.output_path("data", "output*.jsonl")) +
+                           glob.glob(self.output_path("data", "output*.pool")),
+                           key=lambda x: int(''.join(filter(str.isdigit, os.path.basename(x)))) or 0)
+        pools = []
+        for filename in filenames:
+            questions = writers.read_questions(filename)
+            if questions:
+                pools.append(questions)
+        return pools
+
+    def final_set_rng(self, seed, set_id):
+        """
+        The RNG that draws the questions of final set set_id: derived from seed, or
+        freshly seeded without one.
+        """
+        if seed is None:
+            return random.Random()
+        return random.Random(util.derive_seed(seed, "final_set", set_id))
+
+    def write_final_set(self, final_questions, set_id):
+        """
+        Writes the questions of a final set to data/final/finalOutput_<set_id>.json/.txt
+        and returns the path of the TXT file the package is built from.
+        """
+        final_json = self.output_path("data", "final", f"finalOutput_{set_id}.json")
+        final_txt = self.output_path("data", "final", f"finalOutput_{set_id}.txt")
+        os.makedirs(self.output_path("data", "final"), exist_ok=True)
+
+        with open(final_json, 'w') as f:
+            json.dump(final_questions, f, indent=4, default=writers.default_converter)
+
+        # The question_text already contains the evaluated formula
+        with writers.TxtWriter(final_txt, collapse_backslashes=False) as writer:
+            for q in final_questions:
+                writer.write(q)
+        return final_txt
+
+    def pick_final_set(self, pools, seed, set_id):
         """
-        all_questions = []
-        for data in data_list:
-            raw_question_text = data.get("question_text", "")
-            formula_index = data.get("formula_index", None)
-            formula_length = data.get("formula_length", 0)
-            latex_question = data.get("latex_question", "")
+        The questions of final set set_id: one variant of every pool, drawn from
+        final_set_rng. Both generate_final_h5p_set and draw_final_set pick through here.
+        """
+        rng = self.final_set_rng(seed, set_id)
+        return [rng.choice(pool) for pool in pools]
 
+    def question_pool(self, data, seed):
+        """
+        The pool of a question as save_pool stores it when it is generated from seed
+        without batch. With keep_compiled the pool is kept per spec and seed.
+        """
+        key = None
+        if self.keep_compiled:
+            key = (json.dumps(data, sort_keys=True, default=str), seed)
+            if key in self.question_pools:
+                return self.question_pools[key]
+        pool = list(self.number_questions(self.iter_question(data, seed)))
+        if key is not None:
+            self.question_pools[key] = pool
+        return pool
+
+    def draw_final_set(self, data_list, seed, set_id):
+        """
+        Draws final set set_id straight from the question specs, without stored pools:
+        the pool of every question is generated under its question_seed and the set is
+        picked from them (see pick_final_set). The result equals the set that
+        generate_final_h5p_set(seed=seed) draws from pools of the same specs and seed
+        generated without batch. Empty pools are skipped, as load_output_pools does.
+        Returns the list of variants.
+        """
+        pools = [self.question_pool(data, self.question_seed(index, seed)) for index, data in enumerate(data_list)]
+        pools = [pool for pool in pools if pool]
+        if not pools:
+            raise ValueError(f"no question has variants for final set {set_id}")
+        return self.pick_final_set(pools, seed, set_id)
+
+    def generate_final_h5p_set(self, times=1, workers=1, progress=None, cancel=None, seed=None, set_ids=None):
+        """
+        Gathers one random question from each output*.json(l)/.pool pool, writes them to finalOutput_i.json/.txt,
+        and calls the H5P generator 'times' times. The packages are named
+        <NAME_H5P>_<i>.h5p; with workers > 1 they are built in a pool of processes.
+        Set i draws its questions from its own RNG derived from seed (default: the master
+        seed), so any set can be rebuilt alone by passing set_ids=[i] instead of times.
+        progress and cancel (see track) are checked once per package.
+        """
+        if seed is None:
+            seed = self.seed
+        pools = self.load_output_pools()
+        jobs = []
+        for set_id in (set_ids if set_ids is not None else range(1, times + 1)):
+            final_questions = self.pick_final_set(pools, seed, set_id)
+            final_txt = self.write_final_set(final_questions, set_id)
+            jobs.append((self.control_file, final_txt, set_id, self.output_dir))
+
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                try:
+                    packages = list(self.track(executor.map(_generate_h5p_job, jobs), len(jobs), progress, cancel))
+                except GenerationCancelled:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        else:
+            self.profiler.set_question("h5p")
+            packages = list(self.track(map(lambda job: _generate_h5p_job(job, self.profiler), jobs),
+                                       len(jobs), progress, cancel))
+
+        for (_, final_txt, set_id, _), package in zip(jobs, packages):
+            util.logger.info(f"Generated final H5P set #{set_id} -> {final_txt}, {package}")
+        return packages
+
+    def batch_latex(self, expr, samples, count, values, sampled_names):
+        """
+        The LaTeX of expr for row i of an iter_batch batch, as latex(i, randomized_params).
+        With template_latex, rational functions of integer parameters are computed
+        exactly over the whole batch (see latex_template.exact_batch), since the
+        formulas printed for MCQ options are mostly such constants; other rows are
+        rendered once per distinct parameter tuple.
+        """
+        memo = vectorized.ParameterMemo(lambda p: self.render_latex(expr, p), sampled_names)
+        exact = None
+        if self.template_latex and isinstance(expr, sp.Basic):
+            with self.profiler.stage("latex"):
+                exact = latex_template.exact_batch(expr, sampled_names, samples, count, values)
+        if exact is None:
+            return lambda i, randomized_params: memo(randomized_params)
+
+        def latex(i, randomized_params):
+            text = exact(i)
+            return text if text is not None else memo(randomized_params)
+        return latex
+
+    def iter_batch(self, data, seed=None):
+        """
+        Vectorized counterpart of the per-variant loop of iter_question. Draws all
+        randomization_count parameter tuples at once as NumPy arrays and evaluates the
+        correct answer and every wrong-answer formula over the whole batch; only the
+        final rows are turned into question dicts. Rows the compiled functions cannot
+        evaluate are computed through the symbolic path. With unique_variants the tuples
+        are distinct and rendered duplicates are dropped, without drawing replacements.
+        Row j is draw j of the streams of seed, so it matches the serial variant j.
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        parameter_key, wrong_key = self.stream_keys(seed)
+
+        raw_question_text = data.get("question_text", "")
+        formula_index = data.get("formula_index", None)
+        formula_length = data.get("formula_length", 0)
+        latex_question = data.get("latex_question", "")
+        parameters = data.get("parameters", [])
+        correct_answer_data = data.get("correct_answer", {})
+        wrong_answers = data.get("wrong_answers", None)
+        answer_number = data.get("answer_number", 0)
+        randomization_count = data.get("randomization_count", 1)
+
+        if randomization_count < 1:
+            return
+        space = self.parameter_space(data)
+        with self.profiler.stage("sample"):
+            count = min(randomization_count, space.size) if self.unique_variants or not space.size else randomization_count
+            draws = np.arange(count)
+            samples = space.sample(draws, parameter_key, self.unique_variants) if count else {}
+            # The batch is drawn at once, so rows the constraints reject are dropped, not redrawn.
+            admissible = space.admissible(samples, count)
+            if not admissible.all():
+                draws = draws[admissible]
+                samples = {name: values[admissible] for name, values in samples.items()}
+            pruned = count - len(draws)
+            count = len(draws)
+        self.report_sampling(data, space, count + pruned, pruned)
+        if count == 0:
+            self.report_variants(data, 0, 0, 0, pruned=pruned, drawn=pruned, size=space.size)
+            return
+        sampled_names = list(samples)
+        columns = [samples[name].tolist() for name in sampled_names]
+        rows = [dict(zip(sampled_names, values)) for values in zip(*columns)] if columns \
+            else [{} for _ in range(count)]
+
+        compiled = self.compile_correct_answer(correct_answer_data, latex_question, parameters)
+        with self.profiler.stage("evaluate_batch"):
+            correct_values = vectorized.evaluate_batch(
+                self.compile_expression(compiled['expr'], compiled['parameter_names'], modules="numpy", form=compiled['form'])
+                if compiled['form'] is not None else None,
+                compiled['parameter_names'], samples, count)
+        correct_latex = self.batch_latex(compiled['expr'], samples, count, correct_values, sampled_names)
+        correct_fallback = vectorized.ParameterMemo(lambda p: self.evaluate_compiled(compiled, p), sampled_names)
+
+        wrong_options = self.compile_wrong_answers(wrong_answers or [], compiled['parameter_names'], modules="numpy")
+        for option in wrong_options:
+            if option['text'] is not None:
+                continue
+            with self.profiler.stage("evaluate_batch"):
+                option['values'] = vectorized.evaluate_batch(
+                    self.compile_expression(option['expr'], compiled['parameter_names'], modules="numpy", form=option['form'])
+                    if option['form'] is not None else None,
+                    compiled['parameter_names'], samples, count)
+            option['latex'] = self.batch_latex(option['expr'], samples, count, option['values'], sampled_names)
+            option['fallback'] = vectorized.ParameterMemo(
+                lambda p, w=option['item']: self.bounded('process_wrong_answer', w, p), sampled_names)
+        if wrong_answers:
+            keep, order = vectorized.choose_wrong_options(len(wrong_options), answer_number,
+                                                          sampling.uniforms(wrong_key, draws, len(wrong_options)))
+
+        def evaluate_option(j, i, randomized_params):
+            option = wrong_options[j]
+            if option['text'] is not None:
+                return option['text']["value"], lambda: option['text']["formula"]
+            if option['values'] is not None and not np.isnan(option['values'][i]):
+                return (str(self.format_value(float(f"{option['values'][i]:.15g}"))),
+                        lambda: option['latex'](i, randomized_params))
+            processed = option['fallback'](randomized_params)
+            return processed["value"], lambda: processed["formula"]
+
+        seen = set()
+        produced = duplicates = timeouts = collisions = rejected = 0
+        for i, randomized_params in enumerate(rows):
+            self.start_budget()
             try:
-                precision = int(data.get("precision"))
-                if precision > 0:
-                    self.precision = precision
-            except (TypeError, ValueError):
-                util.logger.error(f"Invalid precision value: {data.get('precision')}")
-
-            parameters = data.get("parameters", [])
-            correct_answer_data = data.get("correct_answer", {})
-            wrong_answers = data.get("wrong_answers", None)
-            answer_number = data.get("answer_number", 0)
-            randomization_count = data.get("randomization_count", 1)
-
-            for _ in range(randomization_count):
-                randomized_params = self.randomize_parameters(parameters)
-                correct_data = self.process_correct_answer(correct_answer_data, latex_question, randomized_params)
+                original_formula = correct_latex(i, randomized_params)
+                if correct_values is not None and not np.isnan(correct_values[i]):
+                    correct_answer = self.format_value(float(f"{correct_values[i]:.15g}"))
+                else:
+                    correct_answer = correct_fallback(randomized_params)
+
                 if formula_index is not None:
                     final_question_text = (raw_question_text[:formula_index] +
-                                            f"\\[{correct_data['original_formula']}\\]" +
+                                            f"\\[{original_formula}\\]" +
                                             raw_question_text[formula_index+formula_length:])
                 else:
                     final_question_text = raw_question_text
 
+                key = self.variant_key(final_question_text, correct_answer)
+                if self.unique_variants and key in seen:
+                    duplicates += 1
+                    continue
+
                 question_dict = {
+                    'variant': int(draws[i]),
                     'question_text': final_question_text,
                     'randomized_params': randomized_params,
-                    'correct_answer': correct_data['correct_answer'],
-                    'original_formula': correct_data['original_formula']
+                    'correct_answer': correct_answer,
+                    'original_formula': original_formula
                 }
 
                 if wrong_answers:
-                    wrong_vals, wrong_formulas = self.process_wrong_answers(wrong_answers, randomized_params, answer_number)
-                    question_dict['wrong_answers'] = wrong_vals
-                    question_dict['wrong_formulas'] = wrong_formulas
+                    picked = self.pick_wrong_options(order[i].tolist(), keep, correct_answer,
+                                                     lambda j: evaluate_option(j, i, randomized_params))
+                    if picked is None:
+                        # The batch is drawn at once, so the row is dropped, not redrawn.
+                        rejected += 1
+                        continue
+                    question_dict['wrong_answers'], question_dict['wrong_formulas'], replaced = picked
+                    collisions += replaced
                 else:
                     question_dict['wrong_answers'] = []
                     question_dict['wrong_formulas'] = []
+            except evaluator.EvaluationTimeout as e:
+                timeouts += 1
+                if not self.retry_after_timeout(data, randomized_params, e, timeouts):
+                    break
+                continue
 
-                all_questions.append(question_dict)
+            if self.unique_variants:
+                seen.add(key)
+            yield question_dict
+            produced += 1
 
-        self.save_to_file(all_questions)
-        self.save_to_txt(all_questions)
+        self.report_variants(data, produced, duplicates, timeouts, collisions, rejected, pruned,
+                             count + pruned, space.size)
+
+    def worker_settings(self):
+        """
+        Constructor arguments that reproduce this instance's generation behaviour in a
+        worker process.
+        """
+        return {
+            'compile_expressions': self.compile_expressions,
+            'solve_equations_once': self.solve_equations_once,
+            'template_latex': self.template_latex,
+            'output_format': self.output_format,
+            'unique_variants': self.unique_variants,
+            'timeout': self.timeout,
+            'max_retries': self.max_retries,
+            'reject_collisions': self.reject_collisions,
+            'collision_retries': self.collision_retries,
+            'parse_cache_dir': self.parse_cache_dir,
+            'profile': self.profile,
+            'trace': self.trace,
+            'output_dir': self.output_dir,
+            'pool_cache_dir': self.pool_cache_dir,
+            'seed': self.seed,
+            'keep_compiled': self.keep_compiled
+        }
+
+    def question_seed(self, index, seed=None):
+        """
+        The seed of the question at index (0-based) under seed (default: the master
+        seed), or None without one. Every question gets its own RNG stream, no matter
+        which process generates it.
+        """
+        if seed is None:
+            seed = self.seed
+        if seed is None:
+            return None
+        return util.derive_seed(seed, "question", index)
+
+    def pool_key(self, data, seed, batch):
+        """
+        The pool cache key of a question: its spec, seed and every setting that changes
+        which variants are generated.
+        """
+        settings = {
+            'compile_expressions': self.compile_expressions,
+            'solve_equations_once': self.solve_equations_once,
+            'template_latex': self.template_latex,
+            'unique_variants': self.unique_variants,
+            'timeout': self.timeout,
+            'max_retries': self.max_retries,
+            'reject_collisions': self.reject_collisions,
+            'collision_retries': self.collision_retries,
+            'batch': batch
+        }
+        return self.pool_cache.key(data, seed, settings)
+
+    def iter_question_variants(self, data_list, batch=False, workers=1, seed=None):
+        """
+        Yields (data, variants) for every question in data_list, in input order, where
+        variants is an iterable of that question's variants.
+        With batch=True every question is generated through the vectorized iter_batch
+        path. With workers > 1 the questions are spread over a pool of processes; with
+        a seed (default: the master seed) the output is identical to a serial run with
+        the same seed.
+        With a pool cache, questions whose key is stored are loaded instead of generated.
+        """
+        if seed is None:
+            seed = self.seed
+        seeds = [self.question_seed(index, seed) for index in range(len(data_list))]
+        jobs = [(self.worker_settings(), data, question_seed, batch)
+                for data, question_seed in zip(data_list, seeds)]
+        keys = [None] * len(jobs)
+        if self.pool_cache is not None:
+            keys = [self.pool_key(data, question_seed, batch) for _, data, question_seed, _ in jobs]
+        cached = [key is not None and key in self.pool_cache for key in keys]
+        if any(cached):
+            util.logger.info(f"Reusing the stored pools of {sum(cached)} of {len(jobs)} questions.")
+
+        missing = [job for job, hit in zip(jobs, cached) if not hit]
+        executor = None
+        if workers > 1 and len(missing) > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(_generate_question_job, missing)
+        try:
+            for (_, data, question_seed, _), key, hit in zip(jobs, keys, cached):
+                questions = self.pool_cache.load(key) if hit else None
+                if questions is not None:
+                    yield data, questions
+                    continue
+                if executor is not None and not hit:
+                    questions, profile = next(results)
+                    self.profiler.merge(profile)
+                    self.profiler.set_question(data.get("latex_question", ""))
+                else:
+                    # Also regenerates a stored pool that turned out to be unreadable.
+                    questions = self.iter_question(data, question_seed, batch)
+                if key is not None:
+                    questions = self.pool_cache.recording(key, questions)
+                yield data, questions
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def iter_questions(self, data_list, batch=False, workers=1, seed=None):
+        """
+        Yields the variants of every question in data_list, in input order.
+        See iter_question_variants for batch, workers and seed.
+        """
+        for _, variants in self.iter_question_variants(data_list, batch, workers, seed):
+            yield from variants
+
+    def perform_logic_all(self, data_list, batch=False, workers=1, seed=None, stream=False):
+        """
+        Processes a list of question dictionaries.
+        For each question, performs the required number of randomizations,
+        aggregates all questions, and writes them to output files.
+        See iter_questions for batch, workers and seed. With stream=True the questions
+        are written as they are generated and never collected; the number of written
+        questions is returned instead of the list.
+        """
+        questions = self.iter_questions(data_list, batch, workers, seed)
+        if not stream:
+            questions = list(questions)
+
+        count = self.save_outputs(questions)
         self.generate_h5p()
-        return all_questions
+        return count if stream else questions
+
+def _generate_h5p_job(job, profiler=None):
+    """
+    Builds one H5P package. Usable as a process-pool entry point: it neither changes
+    the working directory nor uses shared temporary files.
+    """
+    control_file, questions_file, h5p_id, output_dir = job
+    control_params = h5p_parser.read_control_file(control_file)
+    output_file = os.path.join(output_dir, h5p_parser.package_name(control_params, h5p_id))
+    return h5p_parser.generate(control_file, questions_file, output_file, profiler=profiler)
+
+def _generate_question_job(job):
+    """
+    Process-pool entry point: generates one question with a fresh Logic instance.
+    Returns the variants and the worker's profile (see Profiler.export).
+    """
+    settings, data, seed, batch = job
+    instance = Logic(**settings)
+    try:
+        return instance.generate_question(data, seed, batch), instance.profiler.export()
+    finally:
+        instance.close_evaluator()
 
 if __name__ == "__main__":
     logic_instance = Logic()
@@ -0,0 +1,143 @@
+# Memoized parse_latex / sympify with an in-process LRU and an optional on-disk layer
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+try:
+    import backend.util as util
+except ModuleNotFoundError:
+    import util
+
+
+def normalize(source):
+    """
+    The cache key of a source string: surrounding whitespace stripped and inner runs
+    of whitespace collapsed to one space, which parses to the same expression.
+    """
+    return " ".join(source.split())
+
+
+class ParseCache:
+    """
+    Caches parsed expressions by (parser, normalized source). The most recent
+    maxsize entries are kept in memory. With a path, successful parses are also
+    pickled to path/<sha256>.pickle so later runs skip parsing; the key includes the
+    SymPy version, so an upgrade never loads stale objects. Only point path at a
+    directory you trust, since its files are unpickled.
+    Failed parses are remembered in memory and raise the same exception again.
+    """
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    # SymPy and the ANTLR-based LaTeX parser are imported on first use only; both are
+    # slow to load and most callers of this module start without needing them.
+    def parse_latex(self, source):
+        from sympy.parsing.latex import parse_latex
+        return self.lookup("latex", source, parse_latex)
+
+    def sympify(self, source):
+        """
+        sp.sympify for strings; anything else (already parsed expressions, numbers)
+        is passed straight to sp.sympify.
+        """
+        import sympy as sp
+        if not isinstance(source, str):
+            return sp.sympify(source)
+        return self.lookup("sympify", source, sp.sympify)
+
+    def lookup(self, kind, source, parser):
+        key = (kind, normalize(source))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                succeeded, result = self.entries[key]
+                if not succeeded:
+                    raise result
+                return result
+
+        succeeded, result = self.load(key)
+        if not succeeded:
+            self.misses += 1
+            try:
+                result = parser(key[1])
+                succeeded = True
+                self.store(key, result)
+            except Exception as e:
+                result = e
+        else:
+            self.hits += 1
+
+        with self.lock:
+            self.entries[key] = (succeeded, result)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        if not succeeded:
+            raise result
+        return result
+
+    def file_for(self, key):
+        import sympy as sp
+        digest = hashlib.sha256("\0".join((sp.__version__,) + key).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{digest}.pickle")
+
+    def load(self, key):
+        if self.path is None:
+            return False, None
+        try:
+            with open(self.file_for(key), "rb") as f:
+                return True, pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            util.logger.warning(f"Ignoring unreadable parse cache entry for {key[1]!r}: {e}")
+            return False, None
+
+    def store(self, key, expr):
+        if self.path is None:
+            return
+        filename = self.file_for(key)
+        temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                pickle.dump(expr, f)
+            # Atomic, so concurrent processes never read a half-written entry.
+            os.replace(temporary, filename)
+        except Exception as e:
+            util.logger.warning(f"Could not write parse cache entry for {key[1]!r}: {e}")
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(path=None):
+    """
+    Returns the process-wide ParseCache for path (None: memory only), so every
+    Logic instance and page in a process shares one LRU.
+    """
+    key = os.path.abspath(path) if path is not None else None
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ParseCache(path=key)
+        return _caches[key]
+
+
+def parse_latex(source):
+    return cache_for().parse_latex(source)
+
+
+def sympify(source):
+    return cache_for().sympify(source)
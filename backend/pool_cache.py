@@ -0,0 +1,110 @@
+# Content-addressed store of generated question pools
+
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import backend.util as util
+    import backend.writers as writers
+except ModuleNotFoundError:
+    import util
+    import writers
+
+# Modules whose code decides what a question's variants look like. Their source is
+# part of every key, so editing the generator invalidates the stored pools. util
+# derives the seeds; instrumentation and the txt2h5p packager do not affect pools.
+GENERATOR_MODULES = ("logic.py", "sampling.py", "vectorized.py", "evaluator.py", "writers.py",
+                     "latex_template.py", "parse_cache.py", "util.py")
+
+_fingerprint = None
+
+
+def generator_fingerprint():
+    """
+    sha256 over the generator modules and the SymPy and NumPy versions.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        import numpy as np
+        import sympy as sp
+        digest = hashlib.sha256(f"sympy {sp.__version__}\0numpy {np.__version__}\0".encode("utf-8"))
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in GENERATOR_MODULES:
+            with open(os.path.join(directory, name), "rb") as f:
+                digest.update(f.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+class PoolCache:
+    """
+    Stores the variants of a question under a hash of everything that determines
+    them: the complete spec (text, formula, parameters, answers, precision, count),
+    the question's seed, the generation settings and the generator code. An unchanged
+    spec therefore maps to the same file and is not regenerated. Pools are kept as
+    path/<sha256>.json and written atomically.
+    Unseeded questions are keyed without a seed, so they also reuse their last pool.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, data, seed, settings):
+        source = json.dumps({
+            "spec": data,
+            "seed": seed,
+            "settings": settings,
+            "generator": generator_fingerprint(),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def file_for(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def __contains__(self, key):
+        return os.path.exists(self.file_for(key))
+
+    def load(self, key):
+        """
+        The stored variants of key, or None when there are none (or they cannot be read).
+        """
+        try:
+            with open(self.file_for(key), "r") as f:
+                questions = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            util.logger.warning(f"Ignoring unreadable pool cache entry {key}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return questions
+
+    def store(self, key, questions):
+        filename = self.file_for(key)
+        temporary = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump(questions, f, default=writers.default_converter)
+            # Atomic, so a concurrent run never reads a half-written pool.
+            os.replace(temporary, filename)
+        except Exception as e:
+            util.logger.warning(f"Could not write pool cache entry {key}: {e}")
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def recording(self, key, questions):
+        """
+        Passes the variants of a question through and stores them once all of them have
+        been produced; an abandoned or failed generation stores nothing.
+        """
+        produced = []
+        for question in questions:
+            produced.append(question)
+            yield question
+        self.store(key, produced)
@@ -0,0 +1,308 @@
+# Compact columnar storage for question pools (the "pool" output format)
+#
+# A .pool file holds the variants of a pool as flat NumPy columns plus an interned
+# string table, so a pool is a fraction of the size of its indented JSON and opening
+# it reads only the header: the columns are memory-mapped and single variants are
+# decoded on access. JSON and TXT are exported from it on demand (see export).
+#
+# Layout: MAGIC, the header length (uint64 little-endian), the JSON header, then the
+# columns at the 8-byte aligned offsets listed in the header.
+
+import json
+import struct
+from array import array
+
+import numpy as np
+
+try:
+    import backend.writers as writers
+except ModuleNotFoundError:
+    import writers
+
+MAGIC = b"RQPOOL\x00\x01"
+ALIGNMENT = 8
+
+# Kinds of an encoded value; the value's 64 bits are interpreted according to its kind.
+INT, FLOAT, STRING, NULL, TRUE, FALSE, BIGINT = range(7)
+
+# Integer and string fields with their own column, and value (list) fields kept columnar.
+INT_FIELDS = ("identifier", "variant")
+STRING_FIELDS = ("question_text", "original_formula")
+LIST_FIELDS = ("wrong_answers", "wrong_formulas")
+COLUMN_FIELDS = INT_FIELDS + ("randomized_params", "correct_answer") + STRING_FIELDS + LIST_FIELDS
+
+
+class StringTable:
+    """
+    Interns strings: every distinct string is stored once and referred to by index.
+    """
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def intern(self, string):
+        position = self.index.get(string)
+        if position is None:
+            position = self.index[string] = len(self.strings)
+            self.strings.append(string)
+        return position
+
+    def arrays(self):
+        encoded = [string.encode("utf-8") for string in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+class ValueColumn:
+    """
+    A column of JSON scalars as a kind byte and 64 bits per value. Values are converted
+    with writers.default_converter first, so they decode to what the JSON output holds.
+    """
+    def __init__(self):
+        self.kinds = bytearray()
+        self.bits = array("Q")
+
+    def append(self, value, strings):
+        if not isinstance(value, (bool, int, float, str)) and value is not None:
+            value = writers.default_converter(value)
+        if value is None:
+            kind, bits = NULL, 0
+        elif value is True or value is False:
+            kind, bits = (TRUE if value else FALSE), 0
+        elif isinstance(value, int):
+            if -2 ** 63 <= value < 2 ** 63:
+                kind, bits = INT, value & 0xFFFFFFFFFFFFFFFF
+            else:
+                kind, bits = BIGINT, strings.intern(str(value))
+        elif isinstance(value, float):
+            kind, bits = FLOAT, struct.unpack("<Q", struct.pack("<d", value))[0]
+        else:
+            kind, bits = STRING, strings.intern(value)
+        self.kinds.append(kind)
+        self.bits.append(bits)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def arrays(self):
+        return np.frombuffer(bytes(self.kinds), dtype=np.uint8), np.asarray(self.bits, dtype="<u8")
+
+
+def is_scalar(value):
+    return not isinstance(value, (list, tuple, dict))
+
+
+class PoolWriter:
+    """
+    Writes questions one by one to a .pool file; has the interface of the JSON
+    writers. The columns are kept in compact arrays and written on close.
+    Fields that do not fit the columns (unexpected keys, nested values, a parameter
+    set that differs from the first question's) are stored as JSON per question.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.strings = StringTable()
+        self.params = None
+        self.integers = {field: array("q") for field in INT_FIELDS}
+        self.layouts = array("I")
+        self.extras = array("i")
+        self.columns = {field: array("I") for field in STRING_FIELDS}
+        self.param_values = ValueColumn()
+        self.correct_answers = ValueColumn()
+        self.lists = {field: (array("q", [0]), ValueColumn()) for field in LIST_FIELDS}
+
+    def write(self, question):
+        if self.params is None:
+            self.params = list(question.get("randomized_params") or {})
+
+        extra = {}
+        strings = self.strings
+        for field in STRING_FIELDS:
+            value = question.get(field)
+            if field in question and not isinstance(value, str):
+                extra[field] = value
+            self.columns[field].append(strings.intern(value) if isinstance(value, str) else 0)
+
+        for field in INT_FIELDS:
+            number = question.get(field, 0)
+            if not isinstance(number, int) or isinstance(number, bool) or not -2 ** 63 <= number < 2 ** 63:
+                extra[field] = number
+                number = 0
+            self.integers[field].append(number)
+
+        params = question.get("randomized_params")
+        if isinstance(params, dict) and list(params) == self.params and all(map(is_scalar, params.values())):
+            for name in self.params:
+                self.param_values.append(params[name], strings)
+        else:
+            if "randomized_params" in question:
+                extra["randomized_params"] = params
+            for _ in self.params:
+                self.param_values.append(None, strings)
+
+        correct = question.get("correct_answer")
+        if not is_scalar(correct):
+            extra["correct_answer"] = correct
+            correct = None
+        self.correct_answers.append(correct, strings)
+
+        for field in LIST_FIELDS:
+            offsets, values = self.lists[field]
+            items = question.get(field)
+            if isinstance(items, list) and all(map(is_scalar, items)):
+                for item in items:
+                    values.append(item, strings)
+            elif field in question:
+                extra[field] = items
+            offsets.append(len(values))
+
+        for key, value in question.items():
+            if key not in COLUMN_FIELDS:
+                extra[key] = value
+        # The key order of every question is kept, so exports match the JSON output byte for byte.
+        # Extras are stored as JSON, which the TXT export only reproduces for JSON values; the
+        # generator hands non-numeric answers over as text (see Logic.evaluate_expression).
+        self.layouts.append(strings.intern(json.dumps([key for key in question])))
+        self.extras.append(strings.intern(json.dumps(extra, default=writers.default_converter)) if extra else -1)
+        self.count += 1
+
+    def close(self):
+        arrays = {field: np.asarray(self.integers[field], dtype="<i8") for field in INT_FIELDS}
+        arrays["layout"] = np.asarray(self.layouts, dtype="<u4")
+        arrays["extra"] = np.asarray(self.extras, dtype="<i4")
+        for field in STRING_FIELDS:
+            arrays[field] = np.asarray(self.columns[field], dtype="<u4")
+        arrays["params.kind"], arrays["params.bits"] = self.param_values.arrays()
+        arrays["correct_answer.kind"], arrays["correct_answer.bits"] = self.correct_answers.arrays()
+        for field, (offsets, values) in self.lists.items():
+            arrays[f"{field}.offsets"] = np.asarray(offsets, dtype="<i8")
+            arrays[f"{field}.kind"], arrays[f"{field}.bits"] = values.arrays()
+        arrays["strings.offsets"], arrays["strings.data"] = self.strings.arrays()
+
+        columns = {}
+        position = 0
+        for name, data in arrays.items():
+            columns[name] = [data.dtype.str, position, len(data)]
+            position += -(-data.nbytes // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({"count": self.count, "params": self.params or [], "columns": columns}).encode("utf-8")
+        # Pads the header so the columns, at offsets relative to its end, stay aligned.
+        header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for name, data in arrays.items():
+                f.write(data.tobytes())
+                f.write(b"\0" * (-data.nbytes % ALIGNMENT))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Pool:
+    """
+    Read-only, memory-mapped view of a .pool file. Supports len(), indexing (which
+    decodes one question dict) and iteration, so it can stand in for the list of
+    questions, e.g. in random.choice.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a question pool file.")
+            length, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+        start = len(MAGIC) + 8 + length
+        self.count = header["count"]
+        self.params = header["params"]
+        self.columns = {}
+        for name, (dtype, offset, size) in header["columns"].items():
+            if size == 0:
+                self.columns[name] = np.zeros(0, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=start + offset, shape=(size,))
+        self.decoded = {}
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def string(self, position):
+        string = self.decoded.get(position)
+        if string is None:
+            offsets = self.columns["strings.offsets"]
+            data = self.columns["strings.data"][offsets[position]:offsets[position + 1]]
+            string = self.decoded[position] = data.tobytes().decode("utf-8")
+        return string
+
+    def value(self, column, position):
+        kind = int(self.columns[f"{column}.kind"][position])
+        bits = self.columns[f"{column}.bits"][position:position + 1]
+        if kind == INT:
+            return int(bits.view("<i8")[0])
+        if kind == FLOAT:
+            return float(bits.view("<f8")[0])
+        if kind == STRING:
+            return self.string(int(bits[0]))
+        if kind == BIGINT:
+            return int(self.string(int(bits[0])))
+        if kind == NULL:
+            return None
+        return kind == TRUE
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("pool index out of range")
+
+        columns = self.columns
+        extra = columns["extra"][index]
+        extra = json.loads(self.string(int(extra))) if extra >= 0 else {}
+        question = {}
+        for key in json.loads(self.string(int(columns["layout"][index]))):
+            if key in extra:
+                question[key] = extra[key]
+            elif key in INT_FIELDS:
+                question[key] = int(columns[key][index])
+            elif key in STRING_FIELDS:
+                question[key] = self.string(int(columns[key][index]))
+            elif key == "randomized_params":
+                first = index * len(self.params)
+                question[key] = {name: self.value("params", first + i) for i, name in enumerate(self.params)}
+            elif key == "correct_answer":
+                question[key] = self.value("correct_answer", index)
+            else:
+                offsets = columns[f"{key}.offsets"]
+                question[key] = [self.value(key, i) for i in range(offsets[index], offsets[index + 1])]
+        return question
+
+
+def export(path, json_path=None, txt_path=None, output_format="json"):
+    """
+    Writes the questions of the pool at path to json_path (as output_format, "json"
+    or "jsonl") and/or txt_path in a single pass. Returns the number of questions.
+    """
+    pool = Pool(path)
+    targets = []
+    if json_path is not None:
+        targets.append(writers.json_writer(json_path, output_format))
+    if txt_path is not None:
+        targets.append(writers.TxtWriter(txt_path))
+    try:
+        for question in pool:
+            for writer in targets:
+                writer.write(question)
+    finally:
+        for writer in targets:
+            writer.close()
+    return len(pool)
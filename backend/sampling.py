@@ -0,0 +1,391 @@
+# Sampling of distinct parameter tuples from the Cartesian product of the parameter domains
+#
+# Constraints between parameters ("Mod(b, a) == 0", "b**2 - 4*a*c > 0") are applied to
+# the domains before anything is drawn (see ParameterSpace), so no answer is evaluated
+# for a tuple that is thrown away afterwards.
+#
+# Every random choice of a variant is a pure function of the question's key and the
+# variant's draw index (counter-based streams, see uniforms): the j-th variant is the
+# same whether it is drawn alone, in order after the others or in a NumPy batch, so
+# any variant can be regenerated from (spec, seed, index).
+
+import math
+import re
+
+import numpy as np
+import sympy as sp
+
+try:
+    import backend.util as util
+    import backend.vectorized as vectorized
+except ModuleNotFoundError:
+    import util
+    import vectorized
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+FEISTEL_ROUNDS = 4
+
+# Constrained products up to this many tuples are checked completely up front; in
+# larger ones a constraint restricts the domain of its last parameter to the values
+# that fit the earlier ones, as each tuple is drawn (up to this many values).
+ENUMERATION_LIMIT = 1 << 20
+CHUNK = 1 << 16
+# Drawn tuples per requested variant that constraints may reject, or that may render
+# like an earlier variant, before a question is given up.
+REJECTION_LIMIT = 100
+
+COMPARISON = re.compile(r"(==|!=|<=|>=|<|>)")
+RELATIONS = {"==": sp.Eq, "!=": sp.Ne, "<=": sp.Le, ">=": sp.Ge, "<": sp.Lt, ">": sp.Gt}
+
+
+def mix64(values):
+    """
+    The splitmix64 finalizer over a uint64 array: a bijective hash whose output bits
+    all depend on every input bit.
+    """
+    z = np.asarray(values, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        z = z + GOLDEN
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def stream_key(seed, label):
+    """
+    The 64-bit key of one named stream (e.g. "parameters") of a question seed.
+    """
+    return util.derive_seed(seed, label)
+
+
+def uniforms(key, draws, width):
+    """
+    A (len(draws), width) array of floats in [0, 1): column c of the row of draw j
+    depends only on key, j and c.
+    """
+    draws = np.asarray(draws, dtype=np.uint64).reshape(-1, 1)
+    columns = np.arange(1, width + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        bits = mix64(mix64(draws ^ np.uint64(key)) + columns * GOLDEN)
+    return (bits >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def choose(randoms, count, cdf=None):
+    """
+    Maps uniform random numbers to indices below count, uniformly or, with the
+    cumulative distribution cdf of the weights, in proportion to them.
+    """
+    if cdf is None:
+        indices = (randoms * count).astype(np.int64)
+    else:
+        indices = np.searchsorted(cdf, randoms, side="right")
+    return np.minimum(indices, count - 1)
+
+
+def cumulative(weights):
+    cdf = np.cumsum(weights, dtype=np.float64)
+    return cdf / cdf[-1]
+
+
+def scalar(value):
+    """
+    A NumPy scalar as the plain Python number; other values (rationals) unchanged.
+    """
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def parse_constraint(text, names):
+    """
+    Parses a constraint such as "Mod(b, a) == 0", "b**2 - 4*a*c > 0" or "0 < a < b"
+    (a chain of comparisons must hold pairwise) into a SymPy condition. Raises
+    ValueError when it is not a condition on the named parameters.
+    """
+    symbols = {name: sp.Symbol(name) for name in names}
+    parts = COMPARISON.split(str(text))
+    if len(parts) > 1:
+        sides = [sp.sympify(part, locals=symbols) for part in parts[::2]]
+        condition = sp.And(*[RELATIONS[operator](lhs, rhs)
+                             for lhs, operator, rhs in zip(sides, parts[1::2], sides[1:])])
+    else:
+        condition = sp.sympify(text, locals=symbols)
+    if not isinstance(condition, sp.logic.boolalg.Boolean):
+        raise ValueError("not a condition")
+    unknown = condition.free_symbols - set(symbols.values())
+    if unknown:
+        raise ValueError(f"unknown parameters {', '.join(sorted(map(str, unknown)))}")
+    return condition
+
+
+class ParameterSpace:
+    """
+    The admissible parameter tuples of a question: the Cartesian product of the
+    parameter domains (see vectorized.parameter_domain), addressed by a single integer
+    index (mixed-radix: the last parameter varies fastest), restricted by the
+    question's constraints. A constraint on one parameter prunes its domain. The
+    others are checked with NumPy on every tuple of the product at once when it has at
+    most ENUMERATION_LIMIT tuples. In a larger product the last parameter of such a
+    constraint is drawn from the values that satisfy it given the parameters before it
+    (see conditional), so sparse constraints such as "Mod(b, a) == 0" still yield
+    tuples; drawn tuples are checked again (see admissible). Only the enumeration
+    materializes the product.
+    """
+    def __init__(self, parameters, constraints=None):
+        domains = {}
+        weights = {}
+        for param in parameters or []:
+            domain = vectorized.parameter_domain(param)
+            if domain is not None:
+                domains[param['name']], weights[param['name']] = domain
+        self.names = list(domains)
+        self.domains = [domains[name] for name in self.names]
+        self.weights = [weights[name] for name in self.names]
+        # Size of the product before any constraint; the base of the acceptance rate.
+        self.total = math.prod(len(values) for values in self.domains)
+
+        if isinstance(constraints, str):
+            constraints = [constraints]
+        self.constrained = False
+        self.checks = []
+        for text in constraints or []:
+            check = self.compile_constraint(text)
+            if check is None:
+                continue
+            self.constrained = True
+            names, func = check
+            if len(names) == 1:
+                position = self.names.index(names[0])
+                keep = self.evaluate(func, [self.domains[position]], len(self.domains[position]))
+                self.domains[position] = self.domains[position][keep]
+                if self.weights[position] is not None:
+                    self.weights[position] = self.weights[position][keep]
+            else:
+                self.checks.append(check)
+        self.size = math.prod(len(values) for values in self.domains)
+
+        # Indices of the admissible tuples of an enumerated product, with their weights.
+        self.accepted = None
+        self.tuple_weights = None
+        self.cdfs = {}
+        self.orders = {}
+        weighted = any(weights is not None for weights in self.weights)
+        if (self.checks or weighted) and 0 < self.size <= ENUMERATION_LIMIT:
+            chunks = []
+            for start in range(0, self.size, CHUNK):
+                indices = np.arange(start, min(start + CHUNK, self.size), dtype=np.int64)
+                chunks.append(indices[self.admissible(self.decode(indices), len(indices))])
+            self.accepted = np.concatenate(chunks)
+            self.checks = []
+            self.size = len(self.accepted)
+            if weighted and self.size:
+                self.tuple_weights = np.ones(self.size)
+                for digits, weights in zip(self.digits(self.accepted), self.weights):
+                    if weights is not None:
+                        self.tuple_weights *= weights[digits]
+
+        # Positions of the parameters drawn given the earlier ones, with their constraints.
+        self.conditions = {}
+        for names, func in self.checks:
+            position = self.names.index(names[-1])
+            if len(self.domains[position]) <= ENUMERATION_LIMIT:
+                self.conditions.setdefault(position, []).append((names, func))
+
+    def compile_constraint(self, text):
+        """
+        The parameter names of a constraint and its condition lambdified for NumPy, or
+        None (after logging why) when it cannot be used.
+        """
+        try:
+            condition = parse_constraint(text, self.names)
+            names = [name for name in self.names if sp.Symbol(name) in condition.free_symbols]
+            func = sp.lambdify([sp.Symbol(name) for name in names], condition, modules="numpy")
+            # Fails here, not halfway through sampling, on conditions NumPy cannot evaluate.
+            self.evaluate(func, [values[:1] for values in self.domains_of(names)], 1)
+        except Exception as e:
+            util.logger.error(f"Ignoring the constraint {text!r}: {e}")
+            return None
+        return names, func
+
+    def domains_of(self, names):
+        return [self.domains[self.names.index(name)] for name in names]
+
+    def evaluate(self, func, arrays, count):
+        """
+        The boolean mask of a lambdified condition over the given value arrays; rows
+        where it is undefined (division by zero, Mod by 0, ...) are inadmissible.
+        count is the number of rows, or the shape the arrays broadcast to.
+        """
+        with np.errstate(all="ignore"):
+            result = func(*[np.asarray(values).astype(np.float64) for values in arrays])
+        return np.broadcast_to(np.asarray(result, dtype=bool), count if isinstance(count, tuple) else (count,))
+
+    def admissible(self, samples, count):
+        """
+        The mask of the rows of samples (a dict of value arrays) that satisfy the
+        constraints still checked per draw; all True once the product is enumerated.
+        """
+        mask = np.ones(count, dtype=bool)
+        for names, func in self.checks:
+            mask &= self.evaluate(func, [samples[name] for name in names], count)
+        return mask
+
+    def admits(self, params):
+        """
+        admissible for a single parameter dict.
+        """
+        return bool(self.admissible({name: np.asarray([value], dtype=object) for name, value in params.items()}, 1)[0])
+
+    def acceptance(self):
+        """
+        The share of the unconstrained product that the constraints admit, or None
+        while they are checked per draw.
+        """
+        if self.checks:
+            return None
+        return self.size / self.total if self.total else 0.0
+
+    def digits(self, indices):
+        """
+        The per-parameter value positions of product indices, in parameter order.
+        """
+        digits = []
+        for values in reversed(self.domains):
+            indices, digit = np.divmod(indices, len(values))
+            digits.append(digit)
+        return digits[::-1]
+
+    def decode(self, indices):
+        """
+        The parameter tuples at product indices, as a dict of value arrays.
+        """
+        return {name: values[digits] for name, values, digits in zip(self.names, self.domains, self.digits(indices))}
+
+    def permute(self, draws, key, size=None):
+        """
+        The positions of the draws in a pseudo-random permutation of range(size) chosen
+        by key, without storing the permutation: a balanced Feistel network over the
+        smallest even number of bits that covers size, whose outputs beyond size are
+        encrypted again (cycle walking) until they fall inside it.
+        """
+        if size is None:
+            size = self.size
+        half = max(1, (max(size - 1, 1).bit_length() + 1) // 2)
+        mask = np.uint64((1 << half) - 1)
+        shift = np.uint64(half)
+        round_keys = mix64(np.arange(FEISTEL_ROUNDS, dtype=np.uint64) ^ np.uint64(key))
+        positions = np.asarray(draws, dtype=np.uint64).copy()
+        if len(positions) and int(positions.max()) >= size:
+            # Cycle walking only ends for positions inside the space.
+            raise IndexError("draw index out of the parameter space")
+        pending = np.ones(len(positions), dtype=bool)
+        while pending.any():
+            left, right = positions[pending] >> shift, positions[pending] & mask
+            for round_key in round_keys:
+                left, right = right, left ^ (mix64(right ^ round_key) & mask)
+            positions[pending] = (left << shift) | right
+            pending &= positions >= np.uint64(size)
+        return positions
+
+    def cdf(self, position):
+        """
+        The cumulative weights of the parameter at position, of the enumerated tuples
+        for None, or None when they are uniform.
+        """
+        if position not in self.cdfs:
+            weights = self.tuple_weights if position is None else self.weights[position]
+            self.cdfs[position] = cumulative(weights) if weights is not None else None
+        return self.cdfs[position]
+
+    def weighted_order(self, key):
+        """
+        The enumerated tuples in a random order of key in which heavier tuples tend to
+        come first: weighted sampling without replacement, by sorting the keys
+        log(u) / weight (Efraimidis-Spirakis).
+        """
+        if key not in self.orders:
+            if len(self.orders) >= 8:
+                # A long-running process sees many seeds; the orders are cheap to redo.
+                self.orders.clear()
+            randoms = uniforms(key, np.arange(self.size), 1)[:, 0]
+            with np.errstate(divide="ignore"):
+                self.orders[key] = np.argsort(-np.log(randoms) / self.tuple_weights, kind="stable")
+        return self.orders[key]
+
+    def positions(self, draws, key, unique):
+        """
+        The product indices of the draws, or None when every parameter is drawn on its own.
+        """
+        if self.accepted is not None:
+            if not unique:
+                picks = choose(uniforms(key, draws, 1)[:, 0], self.size, self.cdf(None))
+            elif self.tuple_weights is not None:
+                picks = self.weighted_order(key)[draws.astype(np.int64)]
+            else:
+                picks = self.permute(draws, key).astype(np.int64)
+            return self.accepted[picks]
+        weighted = any(weights is not None for weights in self.weights)
+        if not unique or weighted or self.conditions or self.size >= 2 ** 63:
+            return None
+        return self.permute(draws, key).astype(np.int64)
+
+    def conditional(self, position, samples, randoms):
+        """
+        Draws the parameter at position for the rows of samples (the parameters before
+        it): each row picks, by its random number, among the values of the domain that
+        satisfy the constraints of conditions[position] given the row, in proportion
+        to their weights. A row that no value satisfies gets the first value, which
+        admissible rejects. Rows are evaluated in blocks of at most ENUMERATION_LIMIT
+        (row, value) pairs.
+        """
+        values = self.domains[position]
+        weights = self.weights[position]
+        name = self.names[position]
+        picks = np.zeros(len(randoms), dtype=np.int64)
+        block = max(1, ENUMERATION_LIMIT // len(values))
+        for start in range(0, len(randoms), block):
+            rows = slice(start, start + block)
+            shape = (len(randoms[rows]), len(values))
+            mask = np.ones(shape, dtype=bool)
+            for names, func in self.conditions[position]:
+                arrays = [values[np.newaxis, :] if other == name else samples[other][rows, np.newaxis]
+                          for other in names]
+                # Chained conditions (And) stack their operands, which needs equal shapes.
+                mask &= self.evaluate(func, np.broadcast_arrays(*arrays), shape)
+            cdf = np.cumsum(mask * weights if weights is not None else mask, axis=1, dtype=np.float64)
+            totals = cdf[:, -1]
+            targets = randoms[rows] * totals
+            picks[rows] = np.where(totals > 0, np.minimum((cdf <= targets[:, np.newaxis]).sum(axis=1), shape[1] - 1), 0)
+        return values[picks]
+
+    def sample(self, draws, key, unique=True):
+        """
+        The parameter tuples of the draws (indices of variants) as a dict of value
+        arrays keyed by parameter name. With unique the draws 0..size-1 are
+        the tuples of the space in a random order, so distinct draws never repeat a
+        tuple. Otherwise, and for weighted, conditionally drawn or too large (for 64-bit
+        indices) spaces that are not enumerated, where a repeat is left to the duplicate
+        check, every parameter is drawn on its own, in order (see conditional).
+        """
+        draws = np.asarray(draws, dtype=np.uint64)
+        if self.size == 0:
+            raise IndexError("the constraints admit no parameter tuple")
+        positions = self.positions(draws, key, unique)
+        if positions is not None:
+            return self.decode(positions)
+        columns = uniforms(key, draws, len(self.names))
+        samples = {}
+        for i, (name, values) in enumerate(zip(self.names, self.domains)):
+            if i in self.conditions:
+                samples[name] = self.conditional(i, samples, columns[:, i])
+            else:
+                samples[name] = values[choose(columns[:, i], len(values), self.cdf(i))]
+        return samples
+
+    def draw(self, index, key, unique=True):
+        """
+        The parameter dict of the single draw index (see sample).
+        """
+        return {name: scalar(values[0]) for name, values in self.sample([index], key, unique).items()}
@@ -0,0 +1,254 @@
+# Long-running service that generates single variants and final sets on request
+#
+# python3 main.py --json-path questions.json --serve 8080 loads the question specs once,
+# compiles them in a pool of worker processes that stay alive, and answers over a
+# local HTTP API (JSON responses, persistent connections):
+#
+#   GET /health                              {"status": "ok", "questions": n, "seed": s}
+#   GET /questions                           every question with its number and variant count
+#   GET /questions/<q>/variants/<k>?seed=s   variant k of question q (see Logic.generate_variant)
+#   GET /final-sets/<i>?seed=s               builds final set i as an H5P package
+#
+# Questions are numbered from 1 as in data/output<n>. s defaults to the seed the server
+# was started with, so every variant and set can be requested again and is identical.
+
+import asyncio
+import json
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import backend.logic as logic
+    import backend.util as util
+    import backend.writers as writers
+except ModuleNotFoundError:
+    import logic
+    import util
+    import writers
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               431: "Request Header Fields Too Large", 500: "Internal Server Error"}
+MAX_HEADERS = 100
+
+ROUTES = (
+    (re.compile(r"/health"), "health"),
+    (re.compile(r"/questions"), "questions"),
+    (re.compile(r"/questions/(\d+)/variants/(\d+)"), "variant"),
+    (re.compile(r"/final-sets/(\d+)"), "final_set"),
+)
+
+# The Logic instance and question specs of a worker process (see _init_worker).
+_instance = None
+_specs = None
+
+
+class RequestError(Exception):
+    """
+    A request that is answered with an error status and message.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _init_worker(settings, specs):
+    """
+    Process-pool initializer: creates the worker's Logic instance and compiles every
+    question up front, so requests only evaluate and render.
+    """
+    global _instance, _specs
+    _instance = logic.Logic(**settings)
+    _specs = specs
+    for data in specs:
+        _instance.compile_question(data)
+
+
+def _ready():
+    return True
+
+
+def _variant_job(question, seed, index):
+    return _instance.generate_variant(_specs[question], _instance.question_seed(question, seed), index)
+
+
+def _final_set_job(seed, set_id):
+    """
+    Draws final set set_id of seed from the specs and builds its package. Returns the
+    package path and the questions.
+    """
+    name = f"{seed}_{set_id}"
+    questions = _instance.draw_final_set(_specs, seed, set_id)
+    final_txt = _instance.write_final_set(questions, name)
+    package = logic._generate_h5p_job((_instance.control_file, final_txt, name, _instance.output_dir))
+    return package, questions
+
+
+class VariantServer:
+    """
+    Serves the questions of data_list. settings are Logic constructor arguments (see
+    Logic.worker_settings); seed is the default master seed, a random one without it.
+    """
+    def __init__(self, data_list, settings, seed=None, workers=1):
+        self.data_list = data_list
+        self.settings = {**settings, "keep_compiled": True}
+        self.seed = seed if seed is not None else random.getrandbits(63)
+        self.workers = max(1, workers)
+        self.executor = None
+        # Final sets being built, so concurrent requests for one set share the build.
+        self.building = {}
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.settings, self.data_list))
+        loop = asyncio.get_running_loop()
+        # Starts (and warms up) every worker before the first request arrives.
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _ready) for _ in range(self.workers)))
+        self.server = await asyncio.start_server(self.handle, host, port)
+        address = self.server.sockets[0].getsockname()
+        util.logger.info(f"Serving {len(self.data_list)} questions on http://{address[0]}:{address[1]} "
+                         f"with seed {self.seed} and {self.workers} workers.")
+        return address
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        await self.start(host, port)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    async def handle(self, reader, writer):
+        """
+        Answers the requests of one connection until the client closes it or asks to.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = await self.read_headers(reader)
+                    length = int(headers.get("content-length", 0))
+                    if length:
+                        # Only GET requests are served; a body is read and ignored.
+                        await reader.readexactly(length)
+                except (RequestError, ValueError) as e:
+                    # The rest of the connection cannot be parsed reliably.
+                    status, message = (e.status, e.message) if isinstance(e, RequestError) else (400, "malformed request")
+                    self.respond(writer, status, {"error": message}, False)
+                    await writer.drain()
+                    break
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                try:
+                    status, body = 200, await self.dispatch(method, target)
+                except RequestError as e:
+                    status, body = e.status, {"error": e.message}
+                except Exception as e:
+                    util.logger.exception(f"Request {request_line!r} failed")
+                    status, body = 500, {"error": str(e)}
+                self.respond(writer, status, body, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_headers(self, reader):
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                return headers
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise RequestError(431, "too many headers")
+
+    def respond(self, writer, status, body, keep_alive):
+        payload = json.dumps(body, default=writers.default_converter).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + payload)
+
+    async def dispatch(self, method, target):
+        url = urlsplit(target)
+        for pattern, name in ROUTES:
+            match = pattern.fullmatch(url.path.rstrip("/") or "/")
+            if match:
+                if method != "GET":
+                    raise RequestError(405, f"{method} is not supported")
+                query = parse_qs(url.query)
+                return await getattr(self, name)(*[int(group) for group in match.groups()], **self.options(query))
+        raise RequestError(404, f"no such resource: {url.path}")
+
+    def options(self, query):
+        seed = query.get("seed", [None])[-1]
+        if seed is None:
+            return {"seed": self.seed}
+        try:
+            return {"seed": int(seed)}
+        except ValueError:
+            raise RequestError(400, "seed must be an integer")
+
+    def question_index(self, question):
+        if not 1 <= question <= len(self.data_list):
+            raise RequestError(404, f"no question {question}; there are {len(self.data_list)}")
+        return question - 1
+
+    async def run(self, job, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, job, *args)
+
+    async def health(self, seed):
+        return {"status": "ok", "questions": len(self.data_list), "seed": seed, "workers": self.workers}
+
+    async def questions(self, seed):
+        return [{"question": index, "latex_question": data.get("latex_question", ""),
+                 "randomization_count": data.get("randomization_count", 1)}
+                for index, data in enumerate(self.data_list, 1)]
+
+    async def variant(self, question, index, seed):
+        question_index = self.question_index(question)
+        try:
+            variant = await self.run(_variant_job, question_index, seed, index)
+        except IndexError:
+            raise RequestError(404, f"question {question} has no variant {index}")
+        if variant is None:
+            raise RequestError(404, f"variant {index} of question {question} was rejected; request another index")
+        return {"question": question, "seed": seed, **variant}
+
+    async def final_set(self, set_id, seed):
+        key = (seed, set_id)
+        if key not in self.building:
+            self.building[key] = asyncio.ensure_future(self.run(_final_set_job, seed, set_id))
+        try:
+            package, questions = await asyncio.shield(self.building[key])
+        except ValueError as e:
+            raise RequestError(404, str(e))
+        finally:
+            self.building.pop(key, None)
+        return {"set": set_id, "seed": seed, "package": package, "questions": questions}
+
+
+def serve(data_list, settings, address, seed=None, workers=1):
+    """
+    Runs a VariantServer on address ("PORT" or "HOST:PORT") until interrupted.
+    """
+    host, _, port = address.rpartition(":")
+    server = VariantServer(data_list, settings, seed, workers)
+    try:
+        asyncio.run(server.serve_forever(host or "127.0.0.1", int(port)))
+    except KeyboardInterrupt:
+        pass
@@ -1,30 +1,17 @@
+import io
 import os
 import sys
 import json
-import shutil
-import time
 import uuid
 import zipfile
+from contextlib import nullcontext
+from functools import lru_cache
+from loguru import logger
 
-
-def create_h5p(directory_path, h5p_filename):
-    if not os.path.isdir(directory_path):
-        raise ValueError("Directory path does not exist.")
-    
-    try:
-        original_dir = os.getcwd()
-        os.chdir(directory_path)
-        with zipfile.ZipFile(os.path.join(original_dir, h5p_filename), 'w') as h5p_file:
-            for root, _, files in os.walk('.'):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    h5p_file.write(file_path, arcname=file_path)
-                    print(f"Added {file_path} as {file_path}")
-        os.chdir(original_dir)
-    except Exception as e:
-        print(f"Error while creating the H5P file: {e}")
-        os.chdir(original_dir)
-        raise
+# H5P libraries bundled into every generated package.
+LIBRARIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "h5p-mcq-616_libs")
+# Control file written by the GUI settings page.
+CONTROL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "control.txt")
 
 
 def parse_line(line, question):
@@ -111,109 +98,42 @@ def parse_fib(line, question):
     })
 
 
-def generate(control_file, questions_file):
-    if not os.path.isfile(control_file):
-        control_file = input(f"ERROR: {control_file} does not exist. Enter the control filename (^C to quit): ")
-
-    if not os.path.isfile(questions_file):
-        questions_file = input(f"ERROR: {questions_file} does not exist. Enter the questions filename (^C to quit): ")
-
-    for file in ["h5p-pr.json", "content-pr.json"]:
-        if os.path.isfile(file):
-            os.remove(file)
-
-    time.sleep(3)
-
+def read_control_file(control_file):
+    """
+    Reads a control file of KEY: value lines into a dict. Raises FileNotFoundError when
+    the file does not exist.
+    """
     control_params = {}
     with open(control_file, 'r') as f:
         for line in f:
             key, value = line.strip().split(':', 1)
             control_params[key.strip()] = value.strip().strip('"')
+    return control_params
 
-    print("The following control parameters were set for the H5P to be made:")
-    for key, value in control_params.items():
-        print(f"{key}: {value}")
 
-    h5p_data = {
-        "title": control_params.get("TITLE", "THIS IS THE TITLE"),
-        "language": "und",
-        "mainLibrary": "H5P.QuestionSet",
-        "embedTypes": ["div"],
-        "authors": [{"name": control_params.get("AUTHOR", "I am The Author"), "role": "Author"}],
-        "license": control_params.get("LICENSE", "ODC PDDL"),
-        "defaultLanguage": "en",
-        "preloadedDependencies": [
-            {"machineName": "H5P.Image", "majorVersion": "1", "minorVersion": "1"},
-            {"machineName": "H5P.MultiChoice", "majorVersion": "1", "minorVersion": "16"},
-            {"machineName": "H5P.Blanks", "majorVersion": "1", "minorVersion": "14"},
-            {"machineName": "H5P.TextUtilities", "majorVersion": "1", "minorVersion": "3"},
-            {"machineName": "FontAwesome", "majorVersion": "4", "minorVersion": "5"},
-            {"machineName": "H5P.JoubelUI", "majorVersion": "1", "minorVersion": "3"},
-            {"machineName": "H5P.Transition", "majorVersion": "1", "minorVersion": "0"},
-            {"machineName": "H5P.FontIcons", "majorVersion": "1", "minorVersion": "0"},
-            {"machineName": "H5P.Question", "majorVersion": "1", "minorVersion": "5"},
-            {"machineName": "H5P.DragQuestion", "majorVersion": "1", "minorVersion": "14"},
-            {"machineName": "jQuery.ui", "majorVersion": "1", "minorVersion": "10"},
-            {"machineName": "H5P.QuestionSet", "majorVersion": "1", "minorVersion": "20"},
-            {"machineName": "H5P.Video", "majorVersion": "1", "minorVersion": "6"},
-            {"machineName": "H5P.MathDisplay", "majorVersion": "1", "minorVersion": "0"}
-        ]
-    }
+# Control file fields whose values are written in double quotes, as the GUI does.
+QUOTED_CONTROL_KEYS = ("TITLE", "AUTHOR", "LICENSE", "INTRODUCTION")
 
-    with open("h5p-pr.json", 'w') as f:
-        json.dump(h5p_data, f, indent=2)
 
-    content_data = {
-        "introPage": {
-            "showIntroPage": True,
-            "startButtonText": "Start Quiz",
-            "title": control_params.get("TITLE", "THIS IS THE TITLE"),
-            "introduction": f"<p>{control_params.get('INTRODUCTION', '')}<br>\n&nbsp;</p>\n"
-        },
-        "progressType": "dots",
-        "passPercentage": int(control_params.get("PASS_PERCENTAGE", 50)),
-        "disableBackwardsNavigation": control_params.get("DISABLE_BACKWARDS_NAVIGATION", "false").lower() == "true",
-        "randomQuestions": control_params.get("RANDOM_QUESTIONS", "true").lower() == "true",
-        "endGame": {
-            "showResultPage": True,
-            "showSolutionButton": True,
-            "showRetryButton": True,
-            "noResultMessage": "Finished",
-            "message": "Your result:",
-            "scoreBarLabel": "You got @finals out of @totals points",
-            "overallFeedback": [{"from": 0, "to": 100}],
-            "solutionButtonText": "Show solution",
-            "retryButtonText": "Retry",
-            "finishButtonText": "Finish",
-            "submitButtonText": "Submit",
-            "showAnimations": False,
-            "skippable": False,
-            "skipButtonText": "Skip video"
-        },
-        "override": {"checkButton": True},
-        "texts": {
-            "prevButton": "Previous question",
-            "nextButton": "Next question",
-            "finishButton": "Finish",
-            "submitButton": "Submit",
-            "textualProgress": "Question: @current of @total questions",
-            "jumpToQuestion": "Question %d of %total",
-            "questionLabel": "Question",
-            "readSpeakerProgress": "Question @current of @total",
-            "unansweredText": "Unanswered",
-            "answeredText": "Answered",
-            "currentQuestionText": "Current question",
-            "navigationLabel": "Questions"
-        },
-        "poolSize": int(control_params.get("POOL_SIZE", 5)),
-        "questions": []
-    }
+def write_control_file(control_file, control_params):
+    """
+    Writes control_params as KEY: value lines, the inverse of read_control_file.
+    """
+    with open(control_file, 'w', encoding="utf-8") as f:
+        for key, value in control_params.items():
+            if isinstance(value, bool):
+                value = str(value).lower()
+            f.write(f'{key}: "{value}"\n' if key in QUOTED_CONTROL_KEYS else f"{key}: {value}\n")
 
-    with open(questions_file, 'r') as f:
-        questions = f.readlines()
 
+def parse_questions(lines):
+    """
+    Parses questions in the txt format (MCQ:/TF:/FIB: blocks) into the H5P question
+    set entries of content.json.
+    """
+    questions = []
     question = None
-    for line in questions:
+    for line in lines:
         line = line.strip()
 
         if not line:
@@ -221,7 +141,7 @@ def generate(control_file, questions_file):
 
         if line.startswith("MCQ:") or line.startswith("TF:"):
             if question:
-                content_data["questions"].append(question)
+                questions.append(question)
             question_type = line.split(':')[0]
             question_text = line[len(question_type) + 1:].strip()
             question = {
@@ -241,10 +161,10 @@ def generate(control_file, questions_file):
 
         elif line.startswith("FIB:"):
             if question:
-                content_data["questions"].append(question)
+                questions.append(question)
             question_type = line.split(':')[0]
             question_text = line[len(question_type) + 1:].strip()
-            print(f"Question: {question_text}")
+            logger.debug(f"Question: {question_text}")
 
             firstIndex = -1
             secondIndex = -1
@@ -287,46 +207,170 @@ def generate(control_file, questions_file):
             parse_line(line.strip(), question)
 
     if question:
-        content_data["questions"].append(question)
+        questions.append(question)
 
-    with open("content-pr.json", 'w') as f:
-        json.dump(content_data, f, indent=2)
+    return questions
 
-    minify_json("h5p-pr.json", "h5p.json")
-    minify_json("content-pr.json", "content.json")
-    
-    name_h5p_dir = control_params.get("NAME_H5P", "myMCQ-fb.h5p").replace('.h5p', '')
-    if os.path.isdir(name_h5p_dir):
-        shutil.rmtree(name_h5p_dir)
 
-    shutil.copytree("./backend/txt2h5p/h5p-mcq-616_libs", name_h5p_dir)
-    os.chmod(name_h5p_dir, 0o755)
+def stage(profiler, name):
+    """
+    Times a step on profiler (anything with a stage(name) context manager, such as
+    backend.instrumentation.Profiler); a no-op without one.
+    """
+    return profiler.stage(name) if profiler is not None else nullcontext()
 
-    content_dir = os.path.join(name_h5p_dir, "content")
-    os.makedirs(content_dir, exist_ok=True)
 
-    shutil.move("h5p.json", os.path.join(name_h5p_dir, "h5p.json"))
-    shutil.move("content.json", os.path.join(content_dir, "content.json"))
+def build_package(control_params, questions, profiler=None):
+    """
+    Builds an H5P question set from the control parameters (see read_control_file) and
+    the questions, given as lines of the txt format. Returns the .h5p archive as bytes.
+    """
+    if isinstance(questions, str):
+        questions = questions.splitlines()
 
-    shutil.move("h5p-pr.json", os.path.join(name_h5p_dir, "h5p-pr.json"))
-    shutil.move("content-pr.json", os.path.join(content_dir, "content-pr.json"))
-
-    output_h5p_file = f"{name_h5p_dir}.h5p"
-    print(f"Creating H5P file: {os.getcwd()}")
-
-    create_h5p(name_h5p_dir, output_h5p_file)
-
-    shutil.rmtree(name_h5p_dir)
-
-    print("Done.")
+    for key, value in control_params.items():
+        logger.debug(f"H5P control parameter {key}: {value}")
 
+    h5p_data = {
+        "title": control_params.get("TITLE", "THIS IS THE TITLE"),
+        "language": "und",
+        "mainLibrary": "H5P.QuestionSet",
+        "embedTypes": ["div"],
+        "authors": [{"name": control_params.get("AUTHOR", "I am The Author"), "role": "Author"}],
+        "license": control_params.get("LICENSE", "ODC PDDL"),
+        "defaultLanguage": "en",
+        "preloadedDependencies": [
+            {"machineName": "H5P.Image", "majorVersion": "1", "minorVersion": "1"},
+            {"machineName": "H5P.MultiChoice", "majorVersion": "1", "minorVersion": "16"},
+            {"machineName": "H5P.Blanks", "majorVersion": "1", "minorVersion": "14"},
+            {"machineName": "H5P.TextUtilities", "majorVersion": "1", "minorVersion": "3"},
+            {"machineName": "FontAwesome", "majorVersion": "4", "minorVersion": "5"},
+            {"machineName": "H5P.JoubelUI", "majorVersion": "1", "minorVersion": "3"},
+            {"machineName": "H5P.Transition", "majorVersion": "1", "minorVersion": "0"},
+            {"machineName": "H5P.FontIcons", "majorVersion": "1", "minorVersion": "0"},
+            {"machineName": "H5P.Question", "majorVersion": "1", "minorVersion": "5"},
+            {"machineName": "H5P.DragQuestion", "majorVersion": "1", "minorVersion": "14"},
+            {"machineName": "jQuery.ui", "majorVersion": "1", "minorVersion": "10"},
+            {"machineName": "H5P.QuestionSet", "majorVersion": "1", "minorVersion": "20"},
+            {"machineName": "H5P.Video", "majorVersion": "1", "minorVersion": "6"},
+            {"machineName": "H5P.MathDisplay", "majorVersion": "1", "minorVersion": "0"}
+        ]
+    }
 
-def minify_json(input_file, output_file):
-    with open(input_file, 'r') as f:
-        data = json.load(f)
-    with open(output_file, 'w') as f:
-        json.dump(data, f, separators=(',',':'),indent=2)
-        f.write('\n')
+    content_data = {
+        "introPage": {
+            "showIntroPage": True,
+            "startButtonText": "Start Quiz",
+            "title": control_params.get("TITLE", "THIS IS THE TITLE"),
+            "introduction": f"<p>{control_params.get('INTRODUCTION', '')}<br>\n&nbsp;</p>\n"
+        },
+        "progressType": "dots",
+        "passPercentage": int(control_params.get("PASS_PERCENTAGE", 50)),
+        "disableBackwardsNavigation": control_params.get("DISABLE_BACKWARDS_NAVIGATION", "false").lower() == "true",
+        "randomQuestions": control_params.get("RANDOM_QUESTIONS", "true").lower() == "true",
+        "endGame": {
+            "showResultPage": True,
+            "showSolutionButton": True,
+            "showRetryButton": True,
+            "noResultMessage": "Finished",
+            "message": "Your result:",
+            "scoreBarLabel": "You got @finals out of @totals points",
+            "overallFeedback": [{"from": 0, "to": 100}],
+            "solutionButtonText": "Show solution",
+            "retryButtonText": "Retry",
+            "finishButtonText": "Finish",
+            "submitButtonText": "Submit",
+            "showAnimations": False,
+            "skippable": False,
+            "skipButtonText": "Skip video"
+        },
+        "override": {"checkButton": True},
+        "texts": {
+            "prevButton": "Previous question",
+            "nextButton": "Next question",
+            "finishButton": "Finish",
+            "submitButton": "Submit",
+            "textualProgress": "Question: @current of @total questions",
+            "jumpToQuestion": "Question %d of %total",
+            "questionLabel": "Question",
+            "readSpeakerProgress": "Question @current of @total",
+            "unansweredText": "Unanswered",
+            "answeredText": "Answered",
+            "currentQuestionText": "Current question",
+            "navigationLabel": "Questions"
+        },
+        "poolSize": int(control_params.get("POOL_SIZE", 5)),
+    }
+    with stage(profiler, "h5p_parse"):
+        content_data["questions"] = parse_questions(questions)
+
+    with stage(profiler, "h5p_zip"):
+        return package_h5p(h5p_data, content_data)
+
+
+def package_name(control_params, h5p_id=""):
+    """
+    File name of the package: NAME_H5P, with "_<h5p_id>" appended to the base name
+    when an id is given.
+    """
+    base_name = control_params.get("NAME_H5P", "myMCQ-fb.h5p").replace('.h5p', '')
+    if h5p_id != "":
+        base_name = f"{base_name}_{h5p_id}"
+    return f"{base_name}.h5p"
+
+
+def generate(control_file, questions_file, output_file=None, profiler=None):
+    """
+    Builds the H5P package described by the control file and the questions file and
+    writes it to output_file (NAME_H5P from the control file by default).
+    Returns the path of the written package. See stage for profiler.
+    """
+    control_params = read_control_file(control_file)
+    with stage(profiler, "h5p_read"), open(questions_file, 'r') as f:
+        lines = f.readlines()
+    package = build_package(control_params, lines, profiler)
+
+    output_file = output_file or package_name(control_params)
+    with stage(profiler, "h5p_write"), open(output_file, 'wb') as f:
+        f.write(package)
+    logger.debug(f"Created H5P file: {os.path.abspath(output_file)}")
+    return output_file
+
+
+@lru_cache(maxsize=None)
+def library_archive():
+    """
+    Zips the bundled H5P libraries once per process. Every package starts from a copy
+    of these bytes, so the library tree is neither copied on disk nor re-read for
+    each package.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for root, dirs, files in os.walk(LIBRARIES_DIR):
+            dirs.sort()
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                archive.write(file_path, arcname=os.path.relpath(file_path, LIBRARIES_DIR))
+    return buffer.getvalue()
+
+
+def minified_json(data):
+    return json.dumps(data, separators=(',',':'), indent=2) + '\n'
+
+
+def package_h5p(h5p_data, content_data):
+    """
+    Builds the .h5p archive in memory: the pre-built library section plus h5p.json and
+    content/content.json (and their pretty-printed -pr copies). Returns the bytes.
+    """
+    buffer = io.BytesIO(library_archive())
+    buffer.seek(0, io.SEEK_END)
+    with zipfile.ZipFile(buffer, 'a') as archive:
+        archive.writestr("h5p.json", minified_json(h5p_data))
+        archive.writestr("h5p-pr.json", json.dumps(h5p_data, indent=2))
+        archive.writestr("content/content.json", minified_json(content_data))
+        archive.writestr("content/content-pr.json", json.dumps(content_data, indent=2))
+    return buffer.getvalue()
 
 
 if __name__ == "__main__":
@@ -337,4 +381,4 @@ if __name__ == "__main__":
     control_file = sys.argv[1]
     questions_file = sys.argv[2]
 
-    generate(control_file, questions_file)
\ No newline at end of file
+    print(f"Created {generate(control_file, questions_file)}")
\ No newline at end of file
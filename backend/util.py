@@ -1,7 +1,43 @@
 # Utility class for common functions/utilities
 
+from collections import OrderedDict
 from loguru import logger
+import hashlib
 import sys
 
 logger.remove()
-logger.add(sys.stderr, level="INFO")
\ No newline at end of file
+logger.add(sys.stderr, level="INFO")
+
+
+def derive_seed(*parts):
+    """
+    Derives a stable 64-bit seed from a master seed and any number of labels, e.g.
+    derive_seed(seed, "question", 3). The result does not depend on the process or
+    on PYTHONHASHSEED.
+    """
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class LRUCache(OrderedDict):
+    """
+    A dict that keeps at most maxsize entries and evicts the least recently used one,
+    for caches of long-running processes.
+    """
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
@@ -0,0 +1,247 @@
+# Vectorized (NumPy) generation of whole variant batches for a single question
+
+import math
+
+import numpy as np
+import sympy as sp
+
+
+def listed(value):
+    """
+    The items of a spec field that holds one value, a list or a comma-separated string.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    return [value]
+
+
+def parse_number(value, kind=None):
+    """
+    Parses one parameter value as kind: "int", "float" or "rational" (a SymPy Rational,
+    from "3/4", "0.75" or 3). Without a kind, integers stay int, fractions "p/q" become
+    rationals and anything else a float. Raises ValueError or TypeError when invalid.
+    """
+    if isinstance(value, bool):
+        raise TypeError("booleans are not parameter values")
+    text = str(value).strip()
+    if kind == "int":
+        return int(text)
+    if kind == "float":
+        return float(text)
+    if kind == "rational":
+        return sp.Rational(text)
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    if "/" in text:
+        return sp.Rational(text)
+    return float(text)
+
+
+def domain_array(values):
+    """
+    Packs parameter values into an array: int64 for integers, float64 for floats and
+    an object array (which keeps exact rationals and mixed types) otherwise.
+    """
+    if all(isinstance(value, int) for value in values):
+        return np.asarray(values, dtype=np.int64)
+    if all(isinstance(value, float) for value in values):
+        return np.asarray(values, dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def parameter_domain(param):
+    """
+    Returns the values a parameter can take and their sampling weights (None for
+    uniform) as arrays. The values are either listed in "values", or the range
+    range_from..range_to (inclusive) in steps of step, of the "type" "int" (default),
+    "float" or "rational". "excluding" removes one or several values (a list or a
+    comma-separated string); "weights", one per value before exclusions, makes some
+    values more likely and removes those of weight 0. Returns None for parameters
+    without a name or with an invalid or empty domain, which are not randomized.
+    """
+    if not param.get('name'):
+        return None
+    kind = param.get('type') or None
+    try:
+        if kind not in (None, "int", "float", "rational"):
+            raise ValueError(f"unknown parameter type {kind}")
+        if param.get('values') not in (None, "", []):
+            values = [parse_number(value, kind) for value in listed(param['values'])]
+        else:
+            kind = kind or "int"
+            range_from = parse_number(param.get('range_from', 0), kind)
+            range_to = parse_number(param.get('range_to', 0), kind)
+            step = parse_number(param.get('step', 1) or 1, kind)
+            if step <= 0:
+                raise ValueError("step must be positive")
+            if kind == "int":
+                values = list(range(range_from, range_to + 1, step))
+            else:
+                # Counted rather than accumulated, so float steps do not drift.
+                count = int(math.floor((range_to - range_from) / step + 1e-9)) + 1
+                values = [range_from + i * step for i in range(max(count, 0))]
+                if kind == "float":
+                    values = [round(value, 12) for value in values]
+        excluding = [parse_number(value, kind) for value in listed(param.get('excluding'))]
+        weights = None
+        if param.get('weights') not in (None, "", []):
+            weights = [float(weight) for weight in listed(param['weights'])]
+            if len(weights) != len(values) or any(weight < 0 or not math.isfinite(weight) for weight in weights):
+                raise ValueError("weights must be one non-negative number per value")
+    except (ValueError, TypeError, ZeroDivisionError):
+        return None
+
+    keep = [i for i, value in enumerate(values) if value not in excluding and (weights is None or weights[i] > 0)]
+    # Repeated listed values would be drawn more often; weights are the way to do that.
+    seen = set()
+    keep = [i for i in keep if not (values[i] in seen or seen.add(values[i]))]
+    if not keep:
+        return None
+    domain = domain_array([values[i] for i in keep])
+    if weights is not None:
+        weights = np.asarray([weights[i] for i in keep], dtype=np.float64)
+    return domain, weights
+
+
+def evaluate_batch(func, parameter_names, samples, count):
+    """
+    Evaluates a numpy-lambdified function over all sampled rows. Returns a float
+    array with NaN wherever the value is not a finite real number (division by zero,
+    complex results, ...), or None when the function cannot be evaluated at all.
+    """
+    if func is None or any(name not in samples for name in parameter_names):
+        return None
+    args = [samples[name].astype(np.float64) for name in parameter_names]
+    try:
+        with np.errstate(all='ignore'):
+            result = np.asarray(func(*args))
+            if np.iscomplexobj(result):
+                result = np.where(result.imag == 0, result.real, np.nan)
+            result = np.broadcast_to(result.astype(np.float64), (count,)).copy()
+    except Exception:
+        return None
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def choose_wrong_options(option_count, answer_number, random_values):
+    """
+    Picks, for every row, a random ordered subset of the wrong options from a
+    (rows, option_count) array of uniform random numbers (see sampling.uniforms).
+    Returns the number of options to keep and a random permutation of all options per
+    row: its first columns are the picks, the remaining ones the replacements for
+    colliding picks.
+    """
+    if answer_number is None or answer_number <= 0:
+        answer_number = option_count
+    keep = min(answer_number, option_count)
+    return keep, np.argsort(random_values, axis=1, kind="stable")
+
+
+class ParameterMemo:
+    """
+    Calls func(params) once per distinct parameter tuple. Batches are usually much
+    larger than the number of distinct tuples, so the slow per-row work (sp.latex,
+    symbolic fallbacks) is shared between identical rows.
+    """
+    def __init__(self, func, parameter_names):
+        self.func = func
+        self.parameter_names = parameter_names
+        self.results = {}
+
+    def __call__(self, params):
+        key = tuple(params.get(name) for name in self.parameter_names)
+        if key not in self.results:
+            try:
+                self.results[key] = (True, self.func(params))
+            except Exception as e:
+                # Remembered too, so a tuple that timed out is not evaluated again.
+                self.results[key] = (False, e)
+        succeeded, result = self.results[key]
+        if not succeeded:
+            raise result
+        return result
+
+
+class RationalArray:
+    """
+    Exact rationals as int64 numerator and denominator arrays (in lowest terms, with
+    positive denominators where defined), with the arithmetic of a lambdified
+    rational function. Intermediate results may overflow; callers compare the result
+    with the float evaluation (see exact_batch). A zero denominator marks a row where
+    the value is undefined.
+    """
+    def __init__(self, numerators, denominators=1):
+        numerators, denominators = np.broadcast_arrays(np.asarray(numerators, dtype=np.int64),
+                                                       np.asarray(denominators, dtype=np.int64))
+        divisors = np.gcd(numerators, denominators)
+        divisors = np.where(divisors == 0, 1, divisors) * np.where(denominators < 0, -1, 1)
+        self.numerators = numerators // divisors
+        self.denominators = denominators // divisors
+
+    @staticmethod
+    def of(value):
+        if isinstance(value, RationalArray):
+            return value
+        if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+            return RationalArray(value)
+        # Floats would make the result inexact.
+        raise TypeError(f"not an exact value: {value!r}")
+
+    def __add__(self, other):
+        other = RationalArray.of(other)
+        return RationalArray(self.numerators * other.denominators + other.numerators * self.denominators,
+                             self.denominators * other.denominators)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return RationalArray(-self.numerators, self.denominators)
+
+    def __sub__(self, other):
+        return self + -RationalArray.of(other)
+
+    def __rsub__(self, other):
+        return RationalArray.of(other) + -self
+
+    def __mul__(self, other):
+        other = RationalArray.of(other)
+        return RationalArray(self.numerators * other.numerators, self.denominators * other.denominators)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        other = RationalArray.of(other)
+        return RationalArray(self.numerators * other.denominators, self.denominators * other.numerators)
+
+    def __rtruediv__(self, other):
+        return RationalArray.of(other) / self
+
+    def __pow__(self, exponent):
+        if not isinstance(exponent, (int, np.integer)) or isinstance(exponent, bool):
+            raise TypeError(f"not an integer exponent: {exponent!r}")
+        if exponent < 0:
+            return RationalArray(self.denominators, self.numerators) ** -int(exponent)
+        return RationalArray(self.numerators ** int(exponent), self.denominators ** int(exponent))
+
+
+def is_rational_function(expr):
+    """
+    True when expr is built from numbers, symbols, sums, products and integer powers
+    only, so integer arguments give an exact rational value.
+    """
+    for node in sp.preorder_traversal(expr):
+        if isinstance(node, sp.Pow):
+            if not node.exp.is_Integer:
+                return False
+        elif not isinstance(node, (sp.Add, sp.Mul, sp.Symbol, sp.Rational)):
+            return False
+    return True
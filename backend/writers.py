@@ -0,0 +1,127 @@
+# Incremental writers for the generated question pools
+
+import json
+import sympy as sp
+
+
+def default_converter(obj):
+    if isinstance(obj, sp.Integer):
+        return int(obj)
+    elif isinstance(obj, sp.Rational):
+        return f"{obj.p}/{obj.q}"
+    return str(obj)
+
+
+class JsonArrayWriter:
+    """
+    Writes questions one by one as a JSON array. The file is byte-identical to
+    json.dumps(questions, indent=4, default=default_converter), but only one question
+    is held in memory at a time.
+    """
+    def __init__(self, path, indent=4):
+        self.file = open(path, 'w')
+        self.indent = indent
+        self.count = 0
+
+    def write(self, question):
+        item = json.dumps(question, indent=self.indent, default=default_converter)
+        prefix = " " * self.indent
+        self.file.write("[\n" if self.count == 0 else ",\n")
+        self.file.write("\n".join(prefix + line for line in item.split("\n")))
+        self.count += 1
+
+    def close(self):
+        self.file.write("[]" if self.count == 0 else "\n]")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonLinesWriter(JsonArrayWriter):
+    """
+    Writes one compact JSON object per line (JSONL).
+    """
+    def write(self, question):
+        self.file.write(json.dumps(question, default=default_converter) + "\n")
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+class TxtWriter:
+    """
+    Writes questions one by one in the txt2h5p input format (MCQ:/FIB: blocks).
+    collapse_backslashes replaces double backslashes in the question header with
+    single ones.
+    """
+    def __init__(self, path, collapse_backslashes=True):
+        self.file = open(path, 'w')
+        self.collapse_backslashes = collapse_backslashes
+        self.count = 0
+
+    def write(self, question):
+        self.count += 1
+        lines = []
+        # The question_text already includes the evaluated formula wrapped in \[ \]
+        question_text = question.get("question_text")
+        if question.get("wrong_answers"):
+            header = f"MCQ: {self.count}. {question_text}"
+            lines.append(header.replace('\\\\', '\\') if self.collapse_backslashes else header)
+            lines.append(f"*{question.get('correct_answer')}")
+            for wa in question.get("wrong_answers"):
+                lines.append(f"{wa}")
+        else:
+            header = f"FIB: {self.count}. {question_text} = *{question.get('correct_answer')}*"
+            lines.append(header.replace('\\\\', '\\') if self.collapse_backslashes else header)
+        lines.append("")
+
+        if self.count > 1:
+            self.file.write("\n")
+        self.file.write("\n".join(lines))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def json_writer(path, output_format="json"):
+    """
+    The pool writer of output_format: "json", "jsonl" or "pool" (see pool_store).
+    """
+    if output_format == "jsonl":
+        return JsonLinesWriter(path)
+    if output_format == "pool":
+        # Imported here: pool_store itself builds on this module.
+        try:
+            import backend.pool_store as pool_store
+        except ModuleNotFoundError:
+            import pool_store
+        return pool_store.PoolWriter(path)
+    return JsonArrayWriter(path)
+
+
+def read_questions(path):
+    """
+    Loads a question pool written by any of the writers of json_writer. A .pool file
+    is opened memory-mapped and returned as a pool_store.Pool, which indexes like a list.
+    """
+    if path.endswith(".pool"):
+        try:
+            import backend.pool_store as pool_store
+        except ModuleNotFoundError:
+            import pool_store
+        return pool_store.Pool(path)
+    with open(path, 'r') as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
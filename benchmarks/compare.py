@@ -0,0 +1,44 @@
+# Compares two result files written by benchmarks/pipeline.py.
+#
+#   python benchmarks/compare.py OLD.json NEW.json
+
+import argparse
+import json
+
+
+def flatten(results, prefix=""):
+    """
+    Maps dotted metric names to the numeric leaves of a results dict.
+    """
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old", help="Baseline result file.")
+    parser.add_argument("new", help="Result file to compare against the baseline.")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    old_metrics = flatten(old["results"])
+    new_metrics = flatten(new["results"])
+
+    print(f"{'metric':<50} {old['commit']:>14} {new['commit']:>14} {'new/old':>8}")
+    for name in sorted(old_metrics.keys() & new_metrics.keys()):
+        before, after = old_metrics[name], new_metrics[name]
+        ratio = f"{after / before:.2f}x" if before else "-"
+        print(f"{name:<50} {before:>14.4g} {after:>14.4g} {ratio:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Cold-start import benchmark for the GUI and CLI entry points.
+#
+# Every target is imported in a fresh interpreter, so nothing is cached between
+# runs. Besides timing, the script checks which heavy modules each entry point
+# pulls in and fails when one shows up where it should load lazily.
+#
+#   python benchmarks/import_time.py [--repeat N] [--limit TARGET=SECONDS ...]
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Target name -> (modules imported, heavy modules that must stay unloaded).
+TARGETS = {
+    # Everything needed before the first window appears.
+    "gui": (["build.app", "build.intro"], ["sympy", "numpy", "antlr4", "backend.logic"]),
+    # The --json-path branch of main.py.
+    "cli": (["backend.logic"], ["tkinter", "PIL", "antlr4"]),
+    "parse_cache": (["backend.parse_cache"], ["sympy", "antlr4"]),
+}
+HEAVY_MODULES = ["tkinter", "PIL", "sympy", "numpy", "antlr4", "backend.logic"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(modules, repeat):
+    """
+    Imports modules in repeat fresh interpreters; returns the timings and the heavy
+    modules that were loaded.
+    """
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(modules=modules, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded = result["loaded"]
+    return timings, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the entry points.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per target.")
+    parser.add_argument("--limit", action="append", default=[], metavar="TARGET=SECONDS",
+                        help="Fail when the median import time of TARGET exceeds SECONDS.")
+    args = parser.parse_args()
+    limits = {name: float(seconds) for name, seconds in (limit.split("=", 1) for limit in args.limit)}
+
+    failures = []
+    print(f"{'target':<12} {'median':>8} {'min':>8}  heavy modules loaded")
+    for name, (modules, forbidden) in TARGETS.items():
+        timings, loaded = measure(modules, args.repeat)
+        median = statistics.median(timings)
+        print(f"{name:<12} {median:>7.3f}s {min(timings):>7.3f}s  {', '.join(loaded) or '-'}")
+
+        unexpected = [module for module in loaded if module in forbidden]
+        if unexpected:
+            failures.append(f"{name} imports {', '.join(unexpected)} eagerly")
+        if name in limits and median > limits[name]:
+            failures.append(f"{name} took {median:.3f}s, limit is {limits[name]:.3f}s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# Benchmark suite for the generation and packaging pipeline.
+#
+# Runs the representative question specs of benchmarks/specs.json through
+# Logic.perform_logic_all, txt2h5p.parser.generate and generate_final_h5p_set in a
+# scratch directory and writes the results to benchmarks/results/<commit>-<time>.json.
+# Compare two result files with benchmarks/compare.py.
+#
+#   python benchmarks/pipeline.py [--repeat N] [--variants N] [--batch] [--workers N]
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import backend.logic as logic
+import backend.txt2h5p.parser as h5p_parser
+from backend import util
+
+SPECS_FILE = Path(__file__).resolve().parent / "specs.json"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def load_specs(variants=None):
+    """
+    Reads the benchmark specs and fills in formula_index/formula_length from the
+    bracketed formula, the way the GUI records them.
+    """
+    with open(SPECS_FILE) as f:
+        specs = json.load(f)
+    for spec in specs.values():
+        formula = f"[{spec['latex_question']}]"
+        spec["formula_index"] = spec["question_text"].index(formula)
+        spec["formula_length"] = len(formula)
+        if variants is not None:
+            spec["randomization_count"] = variants
+    return specs
+
+
+def commit():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{revision}-dirty" if dirty else revision
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and of its (pool) children, in MiB.
+    """
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20,
+    }
+
+
+def timed(func, repeat):
+    """
+    Runs func repeat times; returns the median wall time and the last result.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def bench_generation(specs, options, repeat):
+    """
+    Variants per second of perform_logic_all, per spec and for the whole set.
+    """
+    results = {}
+
+    def run(data_list):
+        instance = logic.Logic()
+        return instance.perform_logic_all(copy.deepcopy(data_list), batch=options.batch,
+                                          workers=options.workers, seed=options.seed, stream=True)
+
+    for name, spec in specs.items():
+        seconds, count = timed(lambda: run([spec]), repeat)
+        results[name] = {"variants": count, "seconds": seconds, "variants_per_second": count / seconds}
+
+    seconds, count = timed(lambda: run(list(specs.values())), repeat)
+    results["all"] = {"variants": count, "seconds": seconds, "variants_per_second": count / seconds}
+    return results
+
+
+def bench_packaging(repeat):
+    """
+    Seconds per package for txt2h5p.parser.generate on the output of the full run.
+    """
+    packages = 10
+    def run():
+        for i in range(packages):
+            h5p_parser.generate(h5p_parser.CONTROL_FILE, "output.txt", f"bench_{i}.h5p")
+    seconds, _ = timed(run, repeat)
+    with open("output.txt") as f:
+        questions = len(h5p_parser.parse_questions(f.readlines()))
+    return {"questions": questions, "seconds_per_package": seconds / packages}
+
+
+def bench_final_sets(specs, options, repeat):
+    """
+    Final H5P sets per second of generate_final_h5p_set, drawn from one pool per spec.
+    """
+    instance = logic.Logic()
+    for spec in specs.values():
+        instance.perform_logic(copy.deepcopy(spec), seed=options.seed)
+    seconds, packages = timed(lambda: instance.generate_final_h5p_set(options.sets, workers=options.workers), repeat)
+    return {"sets": len(packages), "seconds": seconds, "sets_per_second": len(packages) / seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation and packaging pipeline.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the median is reported.")
+    parser.add_argument("--variants", type=int, default=None, help="Override randomization_count of every spec.")
+    parser.add_argument("--sets", type=int, default=20, help="Final H5P sets generated per run.")
+    parser.add_argument("--batch", action="store_true", help="Use the vectorized batch path.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used for generation and packaging.")
+    parser.add_argument("--seed", type=int, default=0, help="Master seed of the generated variants.")
+    parser.add_argument("--output", type=str, default=None, help="Result file (default: benchmarks/results/<commit>-<time>.json).")
+    options = parser.parse_args()
+
+    util.logger.disable("backend")
+    specs = load_specs(options.variants)
+    revision = commit()
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        results["generation"] = bench_generation(specs, options, options.repeat)
+        results["packaging"] = bench_packaging(options.repeat)
+        results["final_sets"] = bench_final_sets(specs, options, options.repeat)
+        os.chdir(ROOT)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    report = {
+        "commit": revision,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(options),
+        "results": results,
+    }
+    output = Path(options.output) if options.output else \
+        RESULTS_DIR / f"{revision}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    for name, result in results["generation"].items():
+        print(f"generation  {name:<20} {result['variants_per_second']:>10.1f} variants/s")
+    print(f"packaging   {'generate':<20} {results['packaging']['seconds_per_package'] * 1000:>10.1f} ms/package")
+    print(f"final sets  {'generate_final_h5p_set':<20} {results['final_sets']['sets_per_second']:>10.1f} sets/s")
+    print(f"peak RSS    {'self / children':<20} {results['peak_rss_mb']['self']:>7.1f} / {results['peak_rss_mb']['children']:.1f} MiB")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# File: app.py
+import importlib
+import tkinter as tk
+from build.jobs import JobRunner
+
+# Page name -> module that defines it. Pages are imported and built the first time
+# they are shown, so startup only pays for the IntroPage.
+PAGE_MODULES = {
+    "IntroPage": "build.intro",
+    # Insert ControlPage between IntroPage and ParametersPage
+    "ControlPage": "build.control",
+    "ParametersPage": "build.parameters",
+    "CorrectPage": "build.correct",
+    "WrongsPage": "build.wrongs",
+    "RandomizerPage": "build.randomizer",
+}
+
+class BaseApp(tk.Tk):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.shared_data = {
+            "question_text": None,
+            "latex_question": None,
+            "has_visited_parameters": False,
+            "has_visited_controller": False,
+            "parameters": [],
+            "correct_answer": None,
+            "wrong_answers": [],
+            "answer_number": None,
+            "randomization_count": 0,
+            "precision": 0,
+            "formula_index":0,
+            "formula_length": 0
+        }
+
+        self.title("Random Question Generator")
+        self.resizable(True, True)
+        self.geometry("1280x900")
+        self.configure(bg="#F5F5F5")
+
+        # make a container that stores all the pages
+        self.container = tk.Frame(self)
+        self.container.pack(side="top", fill="both", expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
+
+        self.frames = {}
+        self._logic = None
+        self.jobs = JobRunner(self)
+
+        self.show_frame("IntroPage")
+
+    @property
+    def logic(self):
+        """
+        The shared backend Logic; backend.logic (SymPy, NumPy) is only imported the
+        first time a page needs it.
+        """
+        if self._logic is None:
+            from backend.logic import Logic
+            self._logic = Logic()
+        return self._logic
+
+    def get_frame(self, page_name):
+        if page_name not in self.frames:
+            page_class = getattr(importlib.import_module(PAGE_MODULES[page_name]), page_name)
+            frame = page_class(parent=self.container, controller=self)
+            self.frames[page_name] = frame
+            frame.grid(row=0, column=0, sticky="nsew")
+        return self.frames[page_name]
+
+    def show_frame(self, page_name):
+        frame = self.get_frame(page_name)
+        frame.tkraise()
+
+    def save_latex_question(self, sympy_expr):
+        self.shared_data["latex_question"] = sympy_expr
+
+    def save_has_visited_parameters(self, bool):
+        self.shared_data["has_visited_parameters"] = bool
+
+    def save_parameters(self, parameters):
+        self.shared_data["parameters"] = parameters
+
+    def save_question_text(self, question_text):
+        self.shared_data["question_text"] = question_text
+
+    def save_precision(self, precision):
+        self.shared_data["precision"] = precision
+
+    def save_formula_index(self, formula_index):
+        self.shared_data["formula_index"] = formula_index
+    def save_formula_length(self, formula_length):
+        self.shared_data["formula_length"] = formula_length
@@ -2,6 +2,7 @@
 import tkinter as tk
 from pathlib import Path
 import backend.util as util
+from backend.txt2h5p.parser import CONTROL_FILE
 
 class ControlPage(tk.Frame):
     def __init__(self, parent, controller):
@@ -167,7 +168,7 @@ class ControlPage(tk.Frame):
             f"N_QUESTIONS: {n_questions}",
         ]
 
-        control_txt_path = Path("./backend/txt2h5p/control.txt")
+        control_txt_path = Path(CONTROL_FILE)
         try:
             with control_txt_path.open("w", encoding="utf-8") as f:
                 for line in control_lines:
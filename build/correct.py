@@ -1,10 +1,7 @@
 from pathlib import Path
 import tkinter as tk
 from tkinter import Tk, Canvas, Entry, Text, Button, PhotoImage, Radiobutton, StringVar
-from sympy.parsing.latex import parse_latex
-from sympy import sympify, Symbol
-from build.wrongs import WrongsPage
-from build.randomizer import RandomizerPage
+import backend.parse_cache as parse_cache
 import backend.util as util
 
 class CorrectPage(tk.Frame):
@@ -72,7 +69,7 @@ class CorrectPage(tk.Frame):
                 entry_1.config(state="normal", fg="#C0C0C0")
                 if entry_1.get() == placeholders[entry_1]:
                     entry_1.config(fg="#C0C0C0")
-                self.function_sympy = sympify(entry_1.get())  
+                self.function_sympy = parse_cache.sympify(entry_1.get())  
 
         radio_auto = tk.Radiobutton(
             self,
@@ -167,7 +164,7 @@ class CorrectPage(tk.Frame):
 
     def convert_latex_to_sympy(self, latex_str):
         try:
-            self.function_sympy = parse_latex(latex_str)
+            self.function_sympy = parse_cache.parse_latex(latex_str)
         except Exception as e:
             util.logger.error(f"Error converting LaTeX to SymPy: {e}")
 
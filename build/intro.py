@@ -179,8 +179,12 @@ class IntroPage(tk.Frame):
             times = int(val)
         except ValueError:
             times = 1
-        logic.generate_final_h5p_set(times)
-        util.logger.info(f"Final H5P Question Set generated {times} times.")
+        self.controller.jobs.submit(
+            "Generating final H5P sets",
+            lambda progress, cancel: logic.generate_final_h5p_set(times, progress=progress, cancel=cancel),
+            unit="sets",
+            on_done=lambda packages: util.logger.info(f"Final H5P Question Set generated {len(packages)} times.")
+        )
 
     def update_final_button(self):
         if self.controller.shared_data.get("has_visited_parameters", False):
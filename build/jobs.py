@@ -0,0 +1,136 @@
+# File: jobs.py
+import queue
+import threading
+import time
+import tkinter as tk
+from tkinter import messagebox, ttk
+import backend.util as util
+
+class JobRunner:
+    """
+    Runs one long generation job at a time on a background thread. The job reports
+    progress through a queue that the Tk event loop polls, so the window keeps
+    responding; a modal ProgressDialog shows the progress and offers Cancel.
+    """
+    POLL_MS = 100
+
+    def __init__(self, root):
+        self.root = root
+        self.dialog = None
+
+    def busy(self):
+        return self.dialog is not None
+
+    def submit(self, title, job, unit="variants", on_done=None):
+        """
+        Starts job(progress, cancel) on a worker thread. progress(done, total) may be
+        called from the job; cancel is a threading.Event the job must check. on_done is
+        called with the job's result on the Tk thread once it finishes successfully.
+        """
+        if self.busy():
+            util.logger.error(f"JobRunner: {title}: another job is still running.")
+            return False
+
+        events = queue.Queue()
+        cancel = threading.Event()
+
+        def run():
+            from backend.logic import GenerationCancelled
+            try:
+                result = job(lambda done, total: events.put(("progress", done, total)), cancel)
+            except GenerationCancelled:
+                events.put(("cancelled",))
+            except Exception as e:
+                util.logger.exception(f"JobRunner: {title} failed.")
+                events.put(("error", e))
+            else:
+                events.put(("done", result))
+
+        self.dialog = ProgressDialog(self.root, title, unit, cancel)
+        threading.Thread(target=run, name=title, daemon=True).start()
+        self.root.after(self.POLL_MS, self.poll, events, title, on_done)
+        return True
+
+    def poll(self, events, title, on_done):
+        finished = None
+        try:
+            while finished is None:
+                event = events.get_nowait()
+                if event[0] == "progress":
+                    self.dialog.update_progress(event[1], event[2])
+                else:
+                    finished = event
+        except queue.Empty:
+            pass
+
+        if finished is None:
+            self.root.after(self.POLL_MS, self.poll, events, title, on_done)
+            return
+
+        self.dialog.close()
+        self.dialog = None
+        if finished[0] == "cancelled":
+            util.logger.info(f"JobRunner: {title} cancelled.")
+        elif finished[0] == "error":
+            messagebox.showerror(title, str(finished[1]), parent=self.root)
+        elif finished[0] == "done" and on_done is not None:
+            on_done(finished[1])
+
+class ProgressDialog(tk.Toplevel):
+    """
+    Modal window with a progress bar, throughput, ETA and a Cancel button.
+    """
+    def __init__(self, parent, title, unit, cancel):
+        super().__init__(parent)
+        self.title(title)
+        self.configure(bg="#F5F5F5")
+        self.resizable(False, False)
+        self.transient(parent)
+        self.protocol("WM_DELETE_WINDOW", self.request_cancel)
+        self.unit = unit
+        self.cancel = cancel
+        self.started = time.monotonic()
+
+        tk.Label(self, text=title, font=("Inter", 16), bg="#F5F5F5", fg="#1E1E1E").pack(padx=20, pady=(20, 10), anchor="w")
+        self.progressbar = ttk.Progressbar(self, orient="horizontal", length=360, mode="indeterminate")
+        self.progressbar.pack(padx=20, pady=5)
+        self.progressbar.start()
+        self.status_label = tk.Label(self, text="Starting...", font=("Inter", 12), bg="#F5F5F5", fg="#757575")
+        self.status_label.pack(padx=20, pady=5, anchor="w")
+        self.cancel_button = tk.Button(
+            self,
+            text="Cancel",
+            font=("Inter", 12),
+            bg="#2D2D2D",
+            fg="white",
+            relief="flat",
+            borderwidth=0,
+            command=self.request_cancel
+        )
+        self.cancel_button.pack(padx=20, pady=(10, 20), anchor="e")
+        self.grab_set()
+
+    def update_progress(self, done, total):
+        if str(self.progressbar.cget("mode")) == "indeterminate":
+            self.progressbar.stop()
+            self.progressbar.config(mode="determinate")
+        self.progressbar.config(maximum=max(total, 1), value=done)
+
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed > 0 else 0
+        status = f"{done} / {total} {self.unit} - {rate:.1f} {self.unit}/s"
+        if rate > 0 and done < total:
+            remaining = int((total - done) / rate)
+            status += f" - ETA {remaining // 60}:{remaining % 60:02d}"
+        self.status_label.config(text=status)
+
+    def request_cancel(self):
+        if not self.cancel.is_set():
+            self.cancel.set()
+            self.cancel_button.config(state="disabled")
+            self.status_label.config(text="Cancelling after the current step...")
+
+    def close(self):
+        self.progressbar.stop()
+        self.grab_release()
+        self.destroy()
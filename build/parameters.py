@@ -1,8 +1,7 @@
 import tkinter as tk
 from pathlib import Path
 from tkinter import PhotoImage, Text
-import sympy as sp
-from sympy.parsing.latex import parse_latex
+import backend.parse_cache as parse_cache
 from PIL import Image, ImageTk
 import backend.util as util
 import re
@@ -113,7 +112,7 @@ class ParametersPage(tk.Frame):
             formula_text = match.group(1)
             try:
                 util.logger.info(f"Formula text: {formula_text}")
-                self.latex_question = parse_latex(formula_text)
+                self.latex_question = parse_cache.parse_latex(formula_text)
                 util.logger.info(f"Parsed expression: {self.latex_question}")
                 return True
             except Exception as e:
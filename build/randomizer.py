@@ -1,8 +1,6 @@
 from pathlib import Path
 import tkinter as tk 
 from tkinter import Canvas, Entry, Button, PhotoImage
-from build.intro import IntroPage
-from backend.logic import Logic
 from backend import util
 
 class RandomizerPage(tk.Frame):
@@ -10,9 +8,6 @@ class RandomizerPage(tk.Frame):
         super().__init__(parent)
         self.controller = controller
         self.configure(bg="#F5F5F5")
-        if not hasattr(self.controller, "logic"):
-            self.controller.logic = Logic()
-        self.logic = self.controller.logic
         self.randomization_count = 0 
         OUTPUT_PATH = Path(__file__).parent
         ASSETS_PATH = OUTPUT_PATH / Path(r"./assets/frame0")
@@ -111,12 +106,21 @@ class RandomizerPage(tk.Frame):
                 return
                 
             self.save_randomization_count()
-            self.logic.perform_logic(self.controller.shared_data)
-            self.controller.shared_data["file_counter"] = self.logic.file_counter
-            self.controller.show_frame("IntroPage")
+            data = dict(self.controller.shared_data)
+            logic = self.controller.logic
+            self.controller.jobs.submit(
+                "Generating variants",
+                lambda progress, cancel: logic.perform_logic(data, progress=progress, cancel=cancel),
+                unit="variants",
+                on_done=self.randomization_done
+            )
             
         except ValueError:
             util.logger.error("RandomizerPage: process_randomization_count: Invalid value entered.")
 
+    def randomization_done(self, questions):
+        self.controller.shared_data["file_counter"] = self.controller.logic.file_counter
+        self.controller.show_frame("IntroPage")
+
     def go_back(self):
         self.controller.show_frame("CorrectPage")
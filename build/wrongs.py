@@ -1,7 +1,7 @@
 import tkinter as tk
 from pathlib import Path
 from tkinter import PhotoImage
-from sympy.parsing.latex import parse_latex 
+import backend.parse_cache as parse_cache
 import backend.util as util
 from PIL import Image, ImageTk
 
@@ -280,7 +280,7 @@ class WrongsPage(tk.Frame):
                 valid_answers += 1
             else:
                 try:
-                    sympy_expr = parse_latex(text)
+                    sympy_expr = parse_cache.parse_latex(text)
                     self.wrong_answers.append(sympy_expr)
                     valid_answers += 1
                 except Exception as e:
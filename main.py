@@ -1,88 +1,54 @@
-import tkinter as tk
 from pathlib import Path
-
-# Add this import for the new ControlPage:
-from build.control import ControlPage
-
-from build.parameters import ParametersPage
-from build.intro import IntroPage
-from build.correct import CorrectPage
-from build.wrongs import WrongsPage
-from build.randomizer import RandomizerPage
 import argparse
-import backend.logic as logic
 import json
-
-class BaseApp(tk.Tk):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        self.shared_data = {
-            "question_text": None,
-            "latex_question": None,
-            "has_visited_parameters": False,
-            "has_visited_controller": False, 
-            "parameters": [], 
-            "correct_answer": None, 
-            "wrong_answers": [], 
-            "answer_number": None,
-            "randomization_count": 0,
-            "precision": 0,
-            "formula_index":0,
-            "formula_length": 0
-        }
-
-        self.title("Random Question Generator")
-        self.resizable(True, True)
-        self.geometry("1280x900")
-        self.configure(bg="#F5F5F5")
-
-        # make a container that stores all the pages
-        container = tk.Frame(self)
-        container.pack(side="top", fill="both", expand=True)
-        container.grid_rowconfigure(0, weight=1)
-        container.grid_columnconfigure(0, weight=1)
-
-        self.frames = {}
-
-        # Insert ControlPage between IntroPage and ParametersPage
-        for F in (IntroPage, ControlPage, ParametersPage, CorrectPage, WrongsPage, RandomizerPage):
-            page_name = F.__name__
-            frame = F(parent=container, controller=self)
-            self.frames[page_name] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
-
-        self.show_frame("IntroPage")
-
-    def show_frame(self, page_name):
-        frame = self.frames[page_name]
-        frame.tkraise()
-
-    def save_latex_question(self, sympy_expr):
-        self.shared_data["latex_question"] = sympy_expr
-    
-    def save_has_visited_parameters(self, bool):
-        self.shared_data["has_visited_parameters"] = bool
-
-    def save_parameters(self, parameters):
-        self.shared_data["parameters"] = parameters
-
-    def save_question_text(self, question_text):
-        self.shared_data["question_text"] = question_text
-
-    def save_precision(self, precision):
-        self.shared_data["precision"] = precision
-
-    def save_formula_index(self, formula_index):
-        self.shared_data["formula_index"] = formula_index
-    def save_formula_length(self, formula_length):
-        self.shared_data["formula_length"] = formula_length
+import sys
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Random Question Generator")
     parser.add_argument("--json-path", type=str, help="Path to the JSON file containing the question data.")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Run the job manifest at this path headlessly; progress is printed as JSON lines.")
+    parser.add_argument("--batch", action="store_true", help="Generate the variants of each question in one vectorized NumPy batch.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to generate the questions in parallel.")
+    parser.add_argument("--seed", type=int, default=None, help="Master seed that makes the generated variants reproducible.")
+    parser.add_argument("--variant", type=str, default=None, metavar="QUESTION:INDEX",
+                        help="Print only the variant of question QUESTION (1-based) with the given \"variant\" index, "
+                             "regenerated from --json-path and --seed.")
+    parser.add_argument("--serve", type=str, default=None, metavar="[HOST:]PORT",
+                        help="Serve variants and final sets of the --json-path questions over a local HTTP API.")
+    parser.add_argument("--stream", action="store_true", help="Write questions as they are generated instead of collecting them in memory.")
+    parser.add_argument("--format", choices=["json", "jsonl", "pool"], default="json",
+                        help="Format of the JSON output file; \"pool\" writes a compact columnar file instead of JSON and TXT.")
+    parser.add_argument("--export", type=str, default=None, metavar="POOL",
+                        help="Export a .pool file to JSON and TXT files next to it and exit.")
+    parser.add_argument("--timeout", type=float, default=None, help="Time budget in seconds for evaluating one variant; slower variants are skipped.")
+    parser.add_argument("--parse-cache", type=str, default=None, help="Directory where parsed expressions are cached between runs.")
+    parser.add_argument("--pool-cache", type=str, default=None,
+                        help="Directory where generated variants are stored; questions whose spec is unchanged are not regenerated.")
+    parser.add_argument("--profile", nargs="?", const="-", default=None, metavar="PATH",
+                        help="Print per-stage timings at the end of the run, or write them as JSON to PATH.")
+    parser.add_argument("--trace", type=str, default=None, metavar="PATH", help="Write a Chrome trace of every timed stage to PATH.")
+    parser.add_argument("--allow-duplicates", action="store_true", help="Sample parameters with replacement and keep repeated variants.")
+    parser.add_argument("--allow-collisions", action="store_true",
+                        help="Keep wrong answers that show the same value as the correct answer or another wrong answer.")
     args = parser.parse_args()
 
+    if args.export:
+        import backend.pool_store as pool_store
+        base = Path(args.export).with_suffix("")
+        count = pool_store.export(args.export, f"{base}.json", f"{base}.txt")
+        print(f"Exported {count} questions to {base}.json and {base}.txt.")
+        exit(0)
+
+    if args.manifest:
+        import backend.batch as batch
+        try:
+            batch.run(batch.load_manifest(args.manifest))
+        except batch.ManifestError as e:
+            print(f"Invalid manifest: {e}", file=sys.stderr)
+            exit(2)
+        exit(0)
+
     if args.json_path:
         json_path = Path(args.json_path)
         print("Multi-input mode enabled.")
@@ -92,11 +58,53 @@ if __name__ == "__main__":
             print("The JSON file is not a list.")
             exit(1)
         # Create a Logic instance and process all questions in the JSON list.
-        logic_instance = logic.Logic()
-        all_questions = logic_instance.perform_logic_all(data_list)
-        print(all_questions)
+        # Imported here: the GUI modules (and tkinter) are never loaded on this path.
+        import backend.logic as logic
+        logic_instance = logic.Logic(output_format=args.format, unique_variants=not args.allow_duplicates,
+                                     reject_collisions=not args.allow_collisions,
+                                     timeout=args.timeout, parse_cache_dir=args.parse_cache,
+                                     pool_cache_dir=args.pool_cache, seed=args.seed,
+                                     profile=args.profile is not None, trace=args.trace is not None)
+        if args.serve:
+            import backend.server as server
+            server.serve(data_list, logic_instance.worker_settings(), args.serve, seed=args.seed, workers=args.workers)
+            exit(0)
+        if args.variant:
+            if args.seed is None:
+                print("--variant needs the --seed of the run that generated the variant.", file=sys.stderr)
+                exit(2)
+            try:
+                question, index = (int(part) for part in args.variant.split(":"))
+                if question < 1 or index < 0:
+                    raise IndexError(args.variant)
+                data = data_list[question - 1]
+            except (ValueError, IndexError):
+                print(f"Invalid --variant {args.variant}; expected QUESTION:INDEX with INDEX >= 0 and 1 <= QUESTION <= {len(data_list)}.",
+                      file=sys.stderr)
+                exit(2)
+            import backend.writers as writers
+            try:
+                variant = logic_instance.generate_variant(data, logic_instance.question_seed(question - 1), index)
+            finally:
+                logic_instance.close_evaluator()
+            print(json.dumps(variant, indent=4, default=writers.default_converter))
+            exit(0 if variant is not None else 1)
+        result = logic_instance.perform_logic_all(data_list, batch=args.batch, workers=args.workers,
+                                                  stream=args.stream)
+        if args.stream:
+            print(f"Generated {result} questions.")
+        else:
+            print(result)
+        if args.profile == "-":
+            print(logic_instance.profiler.format_summary())
+        elif args.profile:
+            with open(args.profile, "w") as f:
+                json.dump(logic_instance.profiler.summary(), f, indent=4)
+        if args.trace:
+            logic_instance.profiler.write_trace(args.trace)
         exit(0)
 
+    from build.app import BaseApp
     app = BaseApp()
     app.resizable(False, False)
     app.mainloop()
@@ -0,0 +1,76 @@
+# Question specs and a generation runner shared by the tests.
+
+import copy
+
+import pytest
+
+import backend.logic as logic
+
+# x**2 = a has two solutions, so the correct answer is a list.
+SQUARE_ROOTS = {
+    "question_text": "Solve $$x**2 = a$$ for x.",
+    "latex_question": "Eq(x**2, a)",
+    "formula_index": 6,
+    "formula_length": 12,
+    "parameters": [{"name": "a", "range_from": "2", "range_to": "30", "step": "1"}],
+    "correct_answer": {"answer_mode": "auto", "function": None},
+    "randomization_count": 5,
+    "precision": 3,
+}
+
+# A multiple-choice question with formula and text distractors.
+LINEAR_EQUATION = {
+    "question_text": "Solve the equation $$ax=b$$ for x.",
+    "latex_question": "Eq(a*x, b)",
+    "formula_index": 19,
+    "formula_length": 9,
+    "parameters": [{"name": "a", "range_from": "1", "range_to": "20", "excluding": "0", "step": "1"},
+                   {"name": "b", "range_from": "1", "range_to": "50", "step": "1"}],
+    "correct_answer": {"answer_mode": "function", "function": "b/a"},
+    "wrong_answers": ["a/b", "a - b", "Just a random string", "a*b"],
+    "answer_number": 3,
+    "randomization_count": 8,
+    "precision": 3,
+}
+
+INTEGRAL = {
+    "question_text": "Compute $$\\int_0^a x^2 dx$$.",
+    "latex_question": "Integral(x**2, (x, 0, a))",
+    "formula_index": 8,
+    "formula_length": 20,
+    "parameters": [{"name": "a", "range_from": "1", "range_to": "9", "step": "1"}],
+    "correct_answer": {"answer_mode": "auto", "function": None},
+    "randomization_count": 6,
+    "precision": 3,
+}
+
+
+@pytest.fixture
+def square_roots():
+    return copy.deepcopy(SQUARE_ROOTS)
+
+
+@pytest.fixture
+def linear_equation():
+    return copy.deepcopy(LINEAR_EQUATION)
+
+
+@pytest.fixture
+def integral():
+    return copy.deepcopy(INTEGRAL)
+
+
+@pytest.fixture
+def generate(tmp_path):
+    """
+    generate(name, data_list, **settings) runs perform_logic_all on a copy of data_list
+    with a Logic(**settings) writing to tmp_path/name. Returns the instance and the
+    output directory.
+    """
+    def generate(name, data_list, **settings):
+        output_dir = tmp_path / name
+        output_dir.mkdir()
+        instance = logic.Logic(output_dir=str(output_dir), **settings)
+        instance.perform_logic_all(copy.deepcopy(data_list))
+        return instance, output_dir
+    return generate
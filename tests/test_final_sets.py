@@ -0,0 +1,30 @@
+# Final sets drawn from the specs (variant server) must equal those built from stored pools.
+
+import backend.logic as logic
+
+
+def test_drawn_final_sets_match_sets_from_stored_pools(tmp_path, linear_equation, integral):
+    seed = 5
+    questions = [linear_equation, integral]
+    stored = logic.Logic(output_dir=str(tmp_path / "pools"), seed=seed)
+    for data in questions:
+        stored.perform_logic(data)
+    set_ids = range(1, 6)
+    stored.generate_final_h5p_set(set_ids=set_ids)
+
+    drawn = logic.Logic(output_dir=str(tmp_path / "drawn"), keep_compiled=True)
+    for set_id in set_ids:
+        drawn.write_final_set(drawn.draw_final_set(questions, seed, set_id), set_id)
+        for suffix in (".json", ".txt"):
+            name = f"finalOutput_{set_id}{suffix}"
+            stored_file = tmp_path / "pools" / "data" / "final" / name
+            drawn_file = tmp_path / "drawn" / "data" / "final" / name
+            assert drawn_file.read_text() == stored_file.read_text()
+
+
+def test_kept_pools_are_bounded(linear_equation):
+    instance = logic.Logic(keep_compiled=True)
+    for seed in range(logic.POOL_CACHE_SIZE + 10):
+        instance.draw_final_set([linear_equation], seed, 1)
+    assert len(instance.question_pools) == logic.POOL_CACHE_SIZE
+    assert len(instance.compiled_questions) == 1
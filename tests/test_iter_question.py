@@ -0,0 +1,24 @@
+# Generation of one question's variants.
+
+import time
+
+import backend.logic as logic
+
+
+def test_few_distinct_renders_in_a_large_space_give_up():
+    # Without a formula in the text, only Mod(a, 3) tells the variants apart.
+    question = {
+        "question_text": "What is a mod 3?",
+        "latex_question": "Mod(a, 3)",
+        "parameters": [{"name": "a", "range_from": "1", "range_to": "1000000", "step": "1"},
+                       {"name": "b", "range_from": "1", "range_to": "1000000", "step": "1"}],
+        "correct_answer": {"answer_mode": "auto", "function": None},
+        "randomization_count": 5,
+        "precision": 0,
+    }
+    instance = logic.Logic(seed=1)
+    started = time.monotonic()
+    variants = list(instance.iter_question(question, 1))
+    assert len(variants) == 3
+    assert sorted(variant["correct_answer"] for variant in variants) == [0, 1, 2]
+    assert time.monotonic() - started < 30
@@ -0,0 +1,54 @@
+# LaTeX templates must render exactly what sp.latex renders.
+
+import numpy as np
+import pytest
+import sympy as sp
+
+import backend.latex_template as latex_template
+import backend.logic as logic
+
+MATRIX = {
+    "question_text": "Compute $$M$$.",
+    "latex_question": "Matrix([[a, b], [b, a]])",
+    "formula_index": 8,
+    "formula_length": 5,
+    "parameters": [{"name": "a", "range_from": "1", "range_to": "9", "step": "1"},
+                   {"name": "b", "range_from": "1", "range_to": "9", "step": "1"}],
+    "correct_answer": {"answer_mode": "auto", "function": None},
+    "wrong_answers": ["Matrix([[b, a], [a, b]])", "a*b"],
+    "answer_number": 2,
+    "randomization_count": 4,
+    "precision": 0,
+}
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_templates_match_sp_latex(batch, linear_equation, integral):
+    for question in (MATRIX, linear_equation, integral):
+        variants = [list(logic.Logic(template_latex=template_latex).iter_question(question, 3, batch=batch))
+                    for template_latex in (True, False)]
+        assert variants[0] == variants[1]
+        assert len(variants[0]) == question["randomization_count"]
+
+
+@pytest.mark.parametrize("formula", ["a/b", "a*b", "a - b", "(a + b)/2", "b**(a + 1)/(a + 1)", "a*sin(b)", "sqrt(a)*b"])
+def test_folding_distractors_render_through_exact_constants(formula):
+    expr = sp.sympify(formula)
+    template = latex_template.LatexTemplate(expr, ["a", "b"])
+    assert template.exact is not None
+    for a in range(-3, 7):
+        for b in (sp.Rational(1, 2), 1, 2, 5, sp.Rational(-7, 3)):
+            params = {"a": a, "b": b}
+            assert template.render(params) == sp.latex(expr.subs(params))
+    assert template.exact is not None
+
+
+def test_exact_batch_falls_back_on_overflow():
+    expr = sp.sympify("a**5/b**3 + 1/a")
+    samples = {"a": np.array([2, 3, 10**6], dtype=np.int64), "b": np.array([1, 4, 7], dtype=np.int64)}
+    values = samples["a"] ** 5.0 / samples["b"] ** 3.0 + 1 / samples["a"]
+    latex = latex_template.exact_batch(expr, ["a", "b"], samples, 3, values)
+    for i in range(2):
+        params = {name: int(column[i]) for name, column in samples.items()}
+        assert latex(i) == sp.latex(expr.subs(params))
+    assert latex(2) is None
@@ -0,0 +1,10 @@
+# A pool loaded from the pool cache must write the same outputs as a generated one.
+
+
+def test_cache_hit_writes_the_outputs_of_a_miss(tmp_path, generate, square_roots):
+    cache_dir = str(tmp_path / "cache")
+    _, miss_dir = generate("miss", [square_roots], pool_cache_dir=cache_dir, seed=7)
+    _, hit_dir = generate("hit", [square_roots], pool_cache_dir=cache_dir, seed=7)
+    assert "*[-sqrt(" in (miss_dir / "output.txt").read_text()
+    for name in ("output.txt", "output.json"):
+        assert (hit_dir / name).read_text() == (miss_dir / name).read_text()
@@ -0,0 +1,11 @@
+# A .pool output must export to the JSON and TXT that --format json writes.
+
+
+def test_export_matches_json_output(generate, square_roots, linear_equation):
+    questions = [square_roots, linear_equation]
+    _, json_dir = generate("json", questions, output_format="json", seed=11)
+    pool, pool_dir = generate("pool", questions, output_format="pool", seed=11)
+    pool.export_outputs("json")
+    for name in ("output.json", "output.txt"):
+        assert (pool_dir / name).read_text() == (json_dir / name).read_text()
+    assert "*[-sqrt(" in (pool_dir / "output.txt").read_text()
@@ -0,0 +1,39 @@
+# Constraints on parameter spaces too large to enumerate.
+
+import numpy as np
+
+import backend.logic as logic
+import backend.sampling as sampling
+
+PARAMETERS = [{"name": "a", "range_from": "1", "range_to": "100000", "step": "1"},
+              {"name": "b", "range_from": "1", "range_to": "100000", "step": "1"}]
+
+
+def test_sparse_constraint_on_a_large_space_yields_admissible_tuples():
+    space = sampling.ParameterSpace(PARAMETERS, ["Mod(b, a) == 0"])
+    assert space.size > sampling.ENUMERATION_LIMIT
+    samples = space.sample(np.arange(200), 42)
+    assert space.admissible(samples, 200).all()
+    assert (samples["b"] % samples["a"] == 0).all()
+    assert space.draw(17, 42) == {name: int(values[17]) for name, values in samples.items()}
+
+
+def test_sparse_constraint_on_a_large_space_fills_the_pool():
+    question = {
+        "question_text": "Solve $$a*x - b$$ = 0.",
+        "latex_question": "a*x - b",
+        "formula_index": 6,
+        "formula_length": 11,
+        "parameters": PARAMETERS,
+        "constraints": ["Mod(b, a) == 0", "b > a"],
+        "correct_answer": {"answer_mode": "function", "function": "b/a"},
+        "randomization_count": 20,
+        "precision": 0,
+    }
+    # The quotients repeat, so repeated variants are kept; the batch drops rejected rows.
+    instance = logic.Logic(unique_variants=False, seed=3)
+    assert len(list(instance.iter_question(question, 3))) == 20
+    for batch in (False, True):
+        for variant in instance.iter_question(question, 3, batch=batch):
+            params = variant["randomized_params"]
+            assert params["b"] % params["a"] == 0 and params["b"] > params["a"]